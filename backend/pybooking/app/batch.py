@@ -0,0 +1,327 @@
+import asyncio
+import os
+import threading
+import time
+import zipfile
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Callable
+
+import orjson
+from fastapi import UploadFile
+from pydantic import ValidationError
+
+from app.cache import all_unclear, extraction_cache, image_key
+from app.compare_columnar import comparison_rows
+from app.compare_fields import summarize
+from app.events import validate_event
+from app.llm_client import llm_extract_each, llm_stream_structured
+from app.metrics import BATCH_BOOKINGS, CACHE_LOOKUPS
+from app.models.models import BatchBooking, BatchManifest, ComparisonItem, ScreenshotResult
+from app.preprocess import submit_compress
+from app.scheduler import AdmissionError, Scheduler
+from app.uploads import MAX_FILE_BYTES, UploadRejected, is_image
+
+# Bookings extracted at the same time by one job.
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+BATCH_MAX_BOOKINGS = int(os.getenv("BATCH_MAX_BOOKINGS", "10000"))
+BATCH_MAX_REQUEST_BYTES = int(os.getenv("BATCH_MAX_REQUEST_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Longest pause before asking a full scheduler queue again.
+BATCH_ADMIT_RETRY_SECONDS = 30.0
+MANIFEST_NAME = "manifest.json"
+
+Reader = Callable[[str], bytes]
+
+
+@dataclass
+class BookingResult:
+    screenshots: list[ScreenshotResult] = field(default_factory=list)
+    image_keys: dict[str, str] = field(default_factory=dict)
+    errors: list[dict] = field(default_factory=list)
+    cached: int = 0
+
+
+def parse_manifest(data: str | bytes) -> list[BatchBooking]:
+    try:
+        bookings = BatchManifest.model_validate_json(data).bookings
+    except ValidationError as exc:
+        raise UploadRejected(422, f"invalid_manifest: {exc.errors()[0]['msg']}")
+    if len({b.id for b in bookings}) != len(bookings):
+        raise UploadRejected(422, "invalid_manifest: booking ids must be unique")
+    return _check_count(bookings)
+
+
+def read_archive(fileobj) -> tuple[list[BatchBooking], Reader]:
+    """
+    Opens a zip of booking screenshots. With a manifest.json at the top
+    level it lists the bookings; otherwise every top-level directory is one
+    booking, named after the directory. Blocking, run it in a thread.
+    """
+
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise UploadRejected(415, "unsupported_archive: expected a zip file")
+    sizes = {
+        info.filename: info.file_size
+        for info in archive.infolist()
+        if not info.is_dir() and not _hidden(info.filename)
+    }
+
+    if MANIFEST_NAME in sizes:
+        bookings = parse_manifest(archive.read(MANIFEST_NAME))
+    else:
+        groups: dict[str, list[str]] = {}
+        for name in sorted(sizes):
+            folder, sep, _ = name.partition("/")
+            if sep:
+                groups.setdefault(folder, []).append(name)
+        bookings = _check_count([BatchBooking(id=folder, files=names) for folder, names in groups.items()])
+
+    def read(name: str) -> bytes:
+        size = sizes.get(name)
+        if size is None:
+            raise FileNotFoundError(f"missing_file: {name}")
+        if size > MAX_FILE_BYTES:
+            raise ValueError(f"file_too_large: {name} exceeds {MAX_FILE_BYTES} bytes")
+        return archive.read(name)
+
+    return bookings, read
+
+
+def upload_reader(files: list[UploadFile]) -> Reader:
+    """
+    Reader over uploaded files, for a manifest sent alongside them.
+    """
+
+    by_name = {file.filename: file for file in files}
+    lock = threading.Lock()  # several bookings may share a file
+
+    def read(name: str) -> bytes:
+        file = by_name.get(name)
+        if file is None:
+            raise FileNotFoundError(f"missing_file: {name}")
+        if file.size is not None and file.size > MAX_FILE_BYTES:
+            raise ValueError(f"file_too_large: {name} exceeds {MAX_FILE_BYTES} bytes")
+        with lock:
+            file.file.seek(0)
+            return file.file.read()
+
+    return read
+
+
+def _hidden(name: str) -> bool:
+    return name.startswith("__MACOSX/") or name.rpartition("/")[2].startswith(".")
+
+
+def _check_count(bookings: list[BatchBooking]) -> list[BatchBooking]:
+    if not bookings:
+        raise UploadRejected(422, "no_bookings: expected a manifest.json or one directory per booking")
+    if len(bookings) > BATCH_MAX_BOOKINGS:
+        raise UploadRejected(413, f"too_many_bookings: at most {BATCH_MAX_BOOKINGS} per job")
+    return bookings
+
+
+def _line(obj: dict) -> bytes:
+    return orjson.dumps(obj, default=str) + b"\n"
+
+
+async def run_batch(
+    bookings: list[BatchBooking],
+    read: Reader,
+    *,
+    client,
+    scheduler: Scheduler,
+    store=None,
+    mode: str = "structured",
+    workers: int = BATCH_WORKERS,
+    price_tolerance: float = 0.0,
+    normalize_dates: bool = False,
+    hotel_similarity: float | None = None,
+) -> AsyncGenerator[bytes, None]:
+    """
+    Async generator of NDJSON lines for a batch job: one "booking" line per
+    booking (extractions, comparisons and verdict) in completion order,
+    "booking_error" for bookings that failed, then one "done" line.
+
+    `workers` bookings are extracted concurrently, each through the shared
+    scheduler like a /stream request. Bookings that finish close together
+    are compared in one columnar pass (comparison_rows).
+    """
+
+    started = time.perf_counter()
+    pending: asyncio.Queue[BatchBooking] = asyncio.Queue()
+    for booking in bookings:
+        pending.put_nowait(booking)
+    finished: asyncio.Queue[tuple[BatchBooking, BookingResult | Exception]] = asyncio.Queue()
+
+    async def worker() -> None:
+        while not pending.empty():
+            booking = pending.get_nowait()
+            try:
+                result = await _extract_booking(booking, read, client, scheduler, store, mode)
+            except Exception as exc:
+                # one broken booking doesn't stop the job
+                finished.put_nowait((booking, exc))
+            else:
+                finished.put_nowait((booking, result))
+
+    tasks = [asyncio.create_task(worker()) for _ in range(max(1, min(workers, len(bookings))))]
+    verdicts: Counter[str] = Counter()
+    failed = 0
+    try:
+        remaining = len(bookings)
+        while remaining:
+            batch = [await finished.get()]
+            while not finished.empty():
+                batch.append(finished.get_nowait())
+            remaining -= len(batch)
+
+            done = [(booking, result) for booking, result in batch if isinstance(result, BookingResult)]
+            rows = comparison_rows(
+                [result.screenshots for _, result in done],
+                price_tolerance=price_tolerance,
+                normalize_dates=normalize_dates,
+                hotel_similarity=hotel_similarity,
+            )
+            lines, saves = [], []
+            for (booking, result), comparisons in zip(done, rows):
+                summary = summarize([c["status"] for c in comparisons])
+                verdicts[summary["overall"]] += 1
+                BATCH_BOOKINGS.labels(summary["overall"]).inc()
+                line = {
+                    "type": "booking",
+                    "booking": booking.id,
+                    "summary": summary,
+                    "comparisons": comparisons,
+                    "extractions": [s.model_dump(mode="json") for s in result.screenshots],
+                    "cached": result.cached,
+                }
+                if result.errors:
+                    line["errors"] = result.errors
+                if store is not None and result.screenshots:
+                    saves.append((line, store.save(
+                        "batch_job",
+                        booking.context,
+                        result.screenshots,
+                        result.image_keys,
+                        [ComparisonItem(**c) for c in comparisons],
+                        summary,
+                    )))
+                lines.append(line)
+            # the group's validations commit together; lines carry ids only once readable
+            saved = await asyncio.gather(*(save for _, save in saves), return_exceptions=True)
+            for (line, _), outcome in zip(saves, saved):
+                if isinstance(outcome, Exception):
+                    line["store_error"] = str(outcome)
+                else:
+                    line["validation_id"] = outcome
+            for line in lines:
+                yield _line(line)
+
+            for booking, exc in batch:
+                if isinstance(exc, Exception):
+                    failed += 1
+                    BATCH_BOOKINGS.labels("error").inc()
+                    yield _line({"type": "booking_error", "booking": booking.id, "error": str(exc)})
+
+        yield _line({
+            "type": "done",
+            "bookings": len(bookings),
+            "verdicts": dict(verdicts),
+            "errors": failed,
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _extract_booking(
+    booking: BatchBooking,
+    read: Reader,
+    client,
+    scheduler: Scheduler,
+    store,
+    mode: str,
+) -> BookingResult:
+    result = BookingResult()
+    by_id: dict[str, ScreenshotResult] = {}
+    uncached: list[tuple[str, bytes]] = []
+
+    # --- Read, then serve what the caches already know ---
+    for name in booking.files:
+        try:
+            data = await asyncio.to_thread(read, name)
+        except (OSError, ValueError, KeyError) as exc:
+            result.errors.append({"message": "file_read_error", "file": name, "error": str(exc)})
+            continue
+        if not is_image(data[:16]):
+            result.errors.append({"message": "unsupported_file_type", "file": name})
+            continue
+        key = image_key(data)
+        result.image_keys[name] = key
+        cached = await extraction_cache.get(key)
+        CACHE_LOOKUPS.labels("miss" if cached is None else "hit").inc()
+        if cached is None:
+            uncached.append((name, data))
+        else:
+            by_id[name] = cached.model_copy(update={"screenshot_id": name})
+    if store is not None and uncached:
+        stored = await store.find_extractions([result.image_keys[name] for name, _ in uncached])
+        for name, _ in uncached:
+            cached = stored.get(result.image_keys[name])
+            if cached is not None:
+                CACHE_LOOKUPS.labels("store_hit").inc()
+                by_id[name] = cached.model_copy(update={"screenshot_id": name})
+        uncached = [(name, data) for name, data in uncached if name not in by_id]
+    result.cached = len(by_id)
+
+    # --- Extract the rest ---
+    if uncached:
+        prepared = await asyncio.gather(*(submit_compress(data) for _, data in uncached))
+        names = [name for name, _ in uncached]
+        del uncached
+
+        while True:
+            try:
+                ticket = scheduler.admit()
+                break
+            except AdmissionError as exc:
+                # queue full: wait instead of failing, /stream traffic goes first
+                await asyncio.sleep(min(BATCH_ADMIT_RETRY_SECONDS, max(1.0, exc.retry_after)))
+        try:
+            cost = len(names) if mode == "per_screenshot" else 1
+            async for _ in scheduler.wait(ticket, cost):
+                pass
+            llm = llm_extract_each if mode == "per_screenshot" else llm_stream_structured
+            async for event in llm(
+                [p.jpeg for p in prepared],
+                names,
+                booking.context,
+                client=client,
+                preprocessed=True,
+            ):
+                if not isinstance(event, dict):
+                    continue
+                if event.get("type") == "progress":
+                    payload = event.get("payload", {})
+                    if "error" in payload:
+                        result.errors.append(payload)
+                    continue
+                try:
+                    screenshot = validate_event(event)
+                except Exception:
+                    continue
+                if screenshot is None or screenshot.screenshot_id not in result.image_keys:
+                    continue
+                by_id[screenshot.screenshot_id] = screenshot
+                if not all_unclear(screenshot):
+                    await extraction_cache.put(result.image_keys[screenshot.screenshot_id], screenshot)
+        finally:
+            scheduler.release(ticket)
+
+    # upload order, like /stream
+    result.screenshots = [by_id[name] for name in booking.files if name in by_id]
+    return result
@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from app.models.models import ScreenshotResult
+
+
+CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "512"))
+CACHE_TTL_SECONDS = float(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", "86400"))
+# Setting a directory enables the on-disk tier.
+CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR")
+CACHE_DISK_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_DISK_MAX_ENTRIES", "10000"))
+
+
+def image_key(data: bytes) -> str:
+    """
+    Content address for an uploaded image: sha256 of the raw bytes.
+    """
+
+    return hashlib.sha256(data).hexdigest()
+
+
+def all_unclear(screenshot: ScreenshotResult) -> bool:
+    """
+    True when no field could be read; such results are not worth caching.
+    """
+
+    return all(value == "unclear" for value in screenshot.extraction.model_dump().values())
+
+
+class ExtractionCache:
+    """
+    Two-tier cache of validated ScreenshotResults keyed by image hash.
+
+    The memory tier is an LRU bounded by entry count; the optional disk tier
+    stores one JSON file per key and is pruned oldest-first. Both tiers expire
+    entries after ttl_seconds.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        disk_dir: str | None = CACHE_DIR,
+        disk_max_entries: int = CACHE_DISK_MAX_ENTRIES,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+        self._memory: OrderedDict[str, tuple[float, ScreenshotResult]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()  # disk count and pruning
+
+        self._disk_dir: Path | None = None
+        self._disk_count = 0
+        if disk_dir:
+            self._disk_dir = Path(disk_dir)
+            self._disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_count = sum(1 for _ in self._disk_dir.glob("*.json"))
+
+    async def get(self, key: str) -> ScreenshotResult | None:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    return result
+                del self._memory[key]
+
+        if self._disk_dir is None:
+            return None
+        # file I/O stays off the event loop
+        entry = await asyncio.to_thread(self._disk_get, key, now)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        # promoted with its original timestamp, so it still expires on time
+        self._memory_put(key, result, stored_at)
+        return result
+
+    async def put(self, key: str, result: ScreenshotResult) -> None:
+        self._memory_put(key, result, time.time())
+        if self._disk_dir is not None:
+            await asyncio.to_thread(self._disk_put, key, result)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self._disk_dir is not None:
+            for path in self._disk_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+            self._disk_count = 0
+
+    def _memory_put(self, key: str, result: ScreenshotResult, now: float) -> None:
+        with self._lock:
+            self._memory[key] = (now, result)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> tuple[float, ScreenshotResult] | None:
+        path = self._disk_dir / f"{key}.json"
+        try:
+            stored_at = path.stat().st_mtime
+            if now - stored_at > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                return None
+            return stored_at, ScreenshotResult.model_validate_json(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Corrupt or stale-schema entry: drop it and treat as a miss.
+            path.unlink(missing_ok=True)
+            return None
+
+    def _disk_put(self, key: str, result: ScreenshotResult) -> None:
+        path = self._disk_dir / f"{key}.json"
+        # unique per writer: puts run concurrently in worker threads
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            existed = path.exists()
+            tmp.write_text(result.model_dump_json())
+            os.replace(tmp, path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            return
+        with self._disk_lock:
+            if not existed:
+                self._disk_count += 1
+            if self._disk_count > self.disk_max_entries:
+                self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """
+        Removes expired entries, then the oldest ones until the disk tier is 10% below its cap.
+        """
+
+        now = time.time()
+        entries = []
+        for path in self._disk_dir.glob("*.json"):
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if now - mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((mtime, path))
+
+        entries.sort()
+        target = int(self.disk_max_entries * 0.9)
+        excess = max(0, len(entries) - target)
+        for _, path in entries[:excess]:
+            path.unlink(missing_ok=True)
+        self._disk_count = len(entries) - excess
+
+
+extraction_cache = ExtractionCache()
@@ -0,0 +1,231 @@
+import re
+from datetime import datetime
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from app.compare_fields import FIELDS
+from app.models.models import ComparisonItem, MatchStatus, ScreenshotClassification, ScreenshotResult
+
+_SIDE = {
+    ScreenshotClassification.INITIAL_QUOTE: 0,
+    ScreenshotClassification.FINAL_BOOKING: 1,
+}
+_OTHER_SIDE = 2
+
+# Unambiguous formats only; dd/mm vs mm/dd can't be told apart.
+_DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%Y/%m/%d",
+    "%d.%m.%Y",
+    "%d %B %Y",
+    "%d %b %Y",
+    "%B %d, %Y",
+    "%b %d, %Y",
+    "%B %d %Y",
+    "%b %d %Y",
+)
+_WEEKDAY = re.compile(r"^(mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?,?\s+", re.IGNORECASE)
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_date(value: str) -> str:
+    """
+    ISO form of a date written in one of _DATE_FORMATS (an optional leading
+    weekday is ignored); anything else is returned unchanged.
+    """
+
+    text = _WEEKDAY.sub("", value.strip())
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return value
+
+
+def normalize_hotel_name(value: str) -> str:
+    return _NON_ALNUM.sub(" ", value.casefold()).strip()
+
+
+def compare_bookings(
+    bookings: list[list[ScreenshotResult]],
+    price_tolerance: float = 0.0,
+    normalize_dates: bool = False,
+    hotel_similarity: float | None = None,
+) -> list[list[ComparisonItem]]:
+    """
+    compare_fields for many bookings at once. With the defaults the result
+    equals [compare_fields(b) for b in bookings]; see comparison_rows for
+    the options.
+    """
+
+    return [
+        [ComparisonItem(**row) for row in rows]
+        for rows in comparison_rows(bookings, price_tolerance, normalize_dates, hotel_similarity)
+    ]
+
+
+def comparison_rows(
+    bookings: list[list[ScreenshotResult]],
+    price_tolerance: float = 0.0,
+    normalize_dates: bool = False,
+    hotel_similarity: float | None = None,
+) -> list[list[dict]]:
+    """
+    Per booking, the comparisons as plain dicts shaped like ComparisonItem
+    (status as its string value), for callers that only serialize them.
+
+    Screenshots are laid out as columns (booking, side, one value column per
+    field) and each field is decided for every booking in a few NumPy
+    passes: values are factorized once, distinct values are counted per
+    booking and side, and the single values of both sides are compared as
+    integer codes.
+
+    The options loosen matching:
+    - price_tolerance: total prices at most this far apart match.
+    - normalize_dates: dates in common written formats are read as ISO dates.
+    - hotel_similarity: hotel names are compared case- and punctuation-
+      insensitively, and names at least this similar (0..1) match.
+    Normalizing happens once per distinct value, not per screenshot.
+    """
+
+    n_bookings = len(bookings)
+    rows = [(b, s) for b, screenshots in enumerate(bookings) for s in screenshots]
+    booking = np.fromiter((b for b, _ in rows), dtype=np.int64, count=len(rows))
+    side = np.fromiter((_SIDE.get(s.classification, _OTHER_SIDE) for _, s in rows), dtype=np.int64, count=len(rows))
+    ids = np.array([s.screenshot_id for _, s in rows], dtype=object)
+
+    results: list[list[dict]] = [[] for _ in range(n_bookings)]
+    for field in FIELDS:
+        raw = np.array([str(getattr(s.extraction, field)) for _, s in rows], dtype=object)
+        normalize = None
+        if field in ("check_in", "check_out") and normalize_dates:
+            normalize = normalize_date
+        elif field == "hotel_name" and hotel_similarity is not None:
+            normalize = normalize_hotel_name
+        items = _compare_column(
+            field,
+            booking,
+            side,
+            ids,
+            raw,
+            n_bookings,
+            normalize,
+            price_tolerance if field == "total_price" else 0.0,
+            hotel_similarity if field == "hotel_name" else None,
+        )
+        for b, item in enumerate(items):
+            results[b].append(item)
+    return results
+
+
+def _compare_column(
+    field: str,
+    booking: np.ndarray,
+    side: np.ndarray,
+    ids: np.ndarray,
+    raw: np.ndarray,
+    n_bookings: int,
+    normalize,
+    tolerance: float,
+    similarity: float | None,
+) -> list[dict]:
+    valid = (raw != "unclear") & (side != _OTHER_SIDE)
+    positions = np.flatnonzero(valid)
+    uniques, codes = _factorize(raw[positions].tolist())
+    if normalize is not None:
+        # re-factorize on the normalized form of each distinct value
+        uniques, remap = _factorize([normalize(u) for u in uniques])
+        codes = remap[codes]
+    n_codes = max(1, len(uniques))
+
+    # distinct (booking, side, value) triples, in order of first appearance
+    group = booking[positions] * 2 + side[positions]
+    pair = group * n_codes + codes
+    distinct, first, inverse = np.unique(pair, return_index=True, return_inverse=True)
+    distinct_group = distinct // n_codes
+    counts = np.bincount(distinct_group, minlength=2 * n_bookings).reshape(n_bookings, 2)
+    code_of = np.full(2 * n_bookings, -1, dtype=np.int64)
+    code_of[distinct_group] = distinct % n_codes
+    code_of = code_of.reshape(n_bookings, 2)
+    # shown value of a group: the raw text of its first screenshot
+    shown_of = np.full(2 * n_bookings, None, dtype=object)
+    shown_of[distinct_group] = raw[positions[first]]
+    shown_of = shown_of.reshape(n_bookings, 2)
+
+    decided = (counts[:, 0] == 1) & (counts[:, 1] == 1)
+    equal = decided & (code_of[:, 0] == code_of[:, 1])
+    loose = np.zeros(n_bookings, dtype=bool)
+    if tolerance > 0 or similarity is not None:
+        for b in np.flatnonzero(decided & ~equal):
+            a, c = uniques[code_of[b, 0]], uniques[code_of[b, 1]]
+            loose[b] = _close(a, c, tolerance) if tolerance > 0 else _similar(a, c, similarity)
+
+    # Evidence: initial then final; within a side grouped by value in order of
+    # first appearance, then by screenshot order (compare_fields' dict order).
+    order = np.lexsort((positions, first[inverse], side[positions], booking[positions]))
+    sorted_booking = booking[positions][order]
+    sorted_ids = ids[positions][order]
+    bounds = np.searchsorted(sorted_booking, np.arange(n_bookings + 1))
+
+    unclear_explanation = (
+        f"Could not determine a single confident value for {field} "
+        f"on both initial and final screenshots."
+    )
+    identical_explanation = f"Values are identical for '{field}'."
+    loose_explanation = f"Values match within tolerance for '{field}'."
+    match, mismatch, unclear = MatchStatus.MATCH.value, MatchStatus.MISMATCH.value, MatchStatus.UNCLEAR.value
+    sorted_ids = sorted_ids.tolist()
+    bounds = bounds.tolist()
+    items = []
+    for b, (is_decided, is_equal, is_loose, (initial_val, final_val)) in enumerate(
+        zip(decided.tolist(), equal.tolist(), loose.tolist(), shown_of.tolist())
+    ):
+        if not is_decided:
+            status, initial_val, final_val = unclear, "unclear", "unclear"
+            explanation = unclear_explanation
+        elif is_equal:
+            # equal once normalized isn't equal as shown
+            status = match
+            explanation = identical_explanation if initial_val == final_val else loose_explanation
+        elif is_loose:
+            status, explanation = match, loose_explanation
+        else:
+            status = mismatch
+            explanation = (
+                f"Initial value '{initial_val}' differs from "
+                f"final value '{final_val}'."
+            )
+        items.append({
+            "field": field,
+            "initial_value": initial_val,
+            "final_value": final_val,
+            "status": status,
+            "explanation": explanation,
+            "evidence": sorted_ids[bounds[b]:bounds[b + 1]],
+        })
+    return items
+
+
+def _factorize(values: list[str]) -> tuple[list[str], np.ndarray]:
+    """
+    Distinct values in order of first appearance, and each value's index
+    among them. A dict compares the Python strings exactly; NumPy's fixed
+    width "<U" strings would drop trailing NUL characters.
+    """
+
+    index: dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values))
+    return list(index), codes
+
+
+def _close(a: str, b: str, tolerance: float) -> bool:
+    try:
+        return abs(float(a) - float(b)) <= tolerance + 1e-9
+    except ValueError:
+        return False
+
+
+def _similar(a: str, b: str, threshold: float) -> bool:
+    return SequenceMatcher(None, a, b).ratio() >= threshold
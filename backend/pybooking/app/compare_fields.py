@@ -28,6 +28,63 @@ def gather_values_from_screenshots(
 
     return dict(grouped)
 
+FIELDS = (
+    "hotel_name",
+    "check_in",
+    "check_out",
+    "guests",
+    "total_price",
+)
+
+
+def compare_field(
+    field: str,
+    initial_values: dict[str, list[str]],
+    final_values: dict[str, list[str]],
+) -> ComparisonItem:
+    # Default placeholders
+    initial_val = "unclear"
+    final_val = "unclear"
+
+    # --- UNCLEAR: missing or conflicting values ---
+    if len(initial_values) != 1 or len(final_values) != 1:
+        status = MatchStatus.UNCLEAR
+        explanation = (
+            f"Could not determine a single confident value for {field} "
+            f"on both initial and final screenshots."
+        )
+        evidence = [
+            *[sid for ids in initial_values.values() for sid in ids],
+            *[sid for ids in final_values.values() for sid in ids],
+        ]
+
+    else:
+        # Exactly one value on each side
+        initial_val, initial_ids = next(iter(initial_values.items()))
+        final_val, final_ids = next(iter(final_values.items()))
+
+        if initial_val == final_val:
+            status = MatchStatus.MATCH
+            explanation = f"Values are identical for '{field}'."
+        else:
+            status = MatchStatus.MISMATCH
+            explanation = (
+                f"Initial value '{initial_val}' differs from "
+                f"final value '{final_val}'."
+            )
+
+        evidence = initial_ids + final_ids
+
+    return ComparisonItem(
+        field=field,
+        initial_value=initial_val,
+        final_value=final_val,
+        status=status,
+        explanation=explanation,
+        evidence=evidence,
+    )
+
+
 def compare_fields(screenshots: list[ScreenshotResult]) -> list[ComparisonItem]:
     initial_screenshots = [
         s for s in screenshots
@@ -38,60 +95,132 @@ def compare_fields(screenshots: list[ScreenshotResult]) -> list[ComparisonItem]:
         if s.classification == ScreenshotClassification.FINAL_BOOKING
     ]
 
-    items: list[ComparisonItem] = []
-
-    for field in (
-        "hotel_name",
-        "check_in",
-        "check_out",
-        "guests",
-        "total_price",
-    ):
-        initial_values = gather_values_from_screenshots(initial_screenshots, field)
-        final_values = gather_values_from_screenshots(final_screenshots, field)
-
-        # Default placeholders
-        initial_val = "unclear"
-        final_val = "unclear"
-
-        # --- UNCLEAR: missing or conflicting values ---
-        if len(initial_values) != 1 or len(final_values) != 1:
-            status = MatchStatus.UNCLEAR
-            explanation = (
-                f"Could not determine a single confident value for {field} "
-                f"on both initial and final screenshots."
-            )
-            evidence = [
-                *[sid for ids in initial_values.values() for sid in ids],
-                *[sid for ids in final_values.values() for sid in ids],
-            ]
+    return [
+        compare_field(
+            field,
+            gather_values_from_screenshots(initial_screenshots, field),
+            gather_values_from_screenshots(final_screenshots, field),
+        )
+        for field in FIELDS
+    ]
+
 
+def summarize(statuses: list[str]) -> dict:
+    """
+    Overall verdict for a booking from the statuses of its comparisons.
+    """
+
+    if not statuses:
+        return {"overall": "unclear", "detail": "no comparison data"}
+    matches = sum(status == MatchStatus.MATCH for status in statuses)
+    mismatches = sum(status == MatchStatus.MISMATCH for status in statuses)
+    unclears = sum(status == MatchStatus.UNCLEAR for status in statuses)
+
+    overall = (
+        "match"
+        if mismatches == 0 and unclears == 0 and matches > 0
+        else "mismatch"
+        if mismatches > 0
+        else "unclear"
+    )
+
+    detail = (
+        f"{matches} match, "
+        f"{mismatches} mismatch, "
+        f"{unclears} unclear"
+    )
+    return {"overall": overall, "detail": detail}
+
+
+def conflicting_screenshots(screenshots: list[ScreenshotResult]) -> set[str]:
+    """
+    Ids of screenshots whose value for some field disagrees with another
+    screenshot of the same classification; such fields come out unclear.
+    """
+
+    conflicting: set[str] = set()
+    for classification in (ScreenshotClassification.INITIAL_QUOTE, ScreenshotClassification.FINAL_BOOKING):
+        side = [s for s in screenshots if s.classification == classification]
+        for field in FIELDS:
+            values = gather_values_from_screenshots(side, field)
+            if len(values) > 1:
+                conflicting.update(sid for ids in values.values() for sid in ids)
+    return conflicting
+
+
+class IncrementalComparator:
+    """
+    Keeps per-field state while extractions arrive and reports a field's
+    comparison as soon as both an initial and a final value exist for it,
+    and again whenever a later screenshot changes it. Adding a screenshot
+    id a second time replaces its earlier result in its original place.
+    Once every screenshot has been added, the latest item per field equals
+    compare_fields' result for the screenshots in the order their ids were
+    first added.
+    """
+
+    def __init__(self):
+        self._by_id: dict[str, ScreenshotResult] = {}
+        self._values: dict[ScreenshotClassification, dict[str, dict[str, list[str]]]] = {
+            ScreenshotClassification.INITIAL_QUOTE: {field: {} for field in FIELDS},
+            ScreenshotClassification.FINAL_BOOKING: {field: {} for field in FIELDS},
+        }
+        self._emitted: dict[str, ComparisonItem] = {}
+
+    def add(self, screenshot: ScreenshotResult) -> list[ComparisonItem]:
+        """
+        Adds one extraction and returns the comparisons it decided or changed.
+        """
+
+        sid = screenshot.screenshot_id
+        previous = self._by_id.get(sid)
+        self._by_id[sid] = screenshot  # an existing id keeps its position
+        if previous is None:
+            touched = self._update(screenshot)
         else:
-            # Exactly one value on each side
-            initial_val, initial_ids = next(iter(initial_values.items()))
-            final_val, final_ids = next(iter(final_values.items()))
-
-            if initial_val == final_val:
-                status = MatchStatus.MATCH
-                explanation = f"Values are identical for '{field}'."
-            else:
-                status = MatchStatus.MISMATCH
-                explanation = (
-                    f"Initial value '{initial_val}' differs from "
-                    f"final value '{final_val}'."
-                )
-
-            evidence = initial_ids + final_ids
-
-        items.append(
-            ComparisonItem(
-                field=field,
-                initial_value=initial_val,
-                final_value=final_val,
-                status=status,
-                explanation=explanation,
-                evidence=evidence,
-            )
-        )
+            # rebuilt rather than patched, so each value's evidence stays in
+            # the order compare_fields would list it
+            touched = self._confident_fields(previous) | self._confident_fields(screenshot)
+            for values in self._values.values():
+                for field in FIELDS:
+                    values[field] = {}
+            for each in self._by_id.values():
+                self._update(each)
+
+        changed = []
+        for field in FIELDS:
+            if field not in touched:
+                continue
+            initial_values = self._values[ScreenshotClassification.INITIAL_QUOTE][field]
+            final_values = self._values[ScreenshotClassification.FINAL_BOOKING][field]
+            if (not initial_values or not final_values) and field not in self._emitted:
+                continue
+            item = compare_field(field, initial_values, final_values)
+            if item != self._emitted.get(field):
+                self._emitted[field] = item
+                changed.append(item)
+        return changed
+
+    @property
+    def screenshots(self) -> list[ScreenshotResult]:
+        return list(self._by_id.values())
+
+    def _confident_fields(self, screenshot: ScreenshotResult) -> set[str]:
+        if screenshot.classification not in self._values:
+            return set()
+        return {field for field in FIELDS if getattr(screenshot.extraction, field) != "unclear"}
+
+    def _update(self, screenshot: ScreenshotResult) -> set[str]:
+        """
+        Adds the screenshot's confident values to the per-field value sets,
+        returning the fields touched.
+        """
 
-    return items
+        side = self._values.get(screenshot.classification)
+        if side is None:
+            return set()
+        touched = self._confident_fields(screenshot)
+        for field in touched:
+            value = getattr(screenshot.extraction, field)
+            side[field].setdefault(str(value), []).append(screenshot.screenshot_id)
+        return touched
@@ -0,0 +1,119 @@
+import os
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Screenshots whose perceptual hashes differ in at most this many of 64 bits
+# are candidate copies of one another; negative (the default) disables
+# deduplication. A 64-bit hash can't see a changed price or date, so
+# candidates are only merged if their pixels match too (same_pixels): in
+# practice only re-uploads of one screenshot, not overlapping crops.
+DEDUPE_MAX_DISTANCE = int(os.getenv("DEDUPE_MAX_DISTANCE", "-1"))
+# Largest per-pixel grayscale difference (0-255) two copies may have, to allow
+# for re-encoding noise; edited text differs by far more.
+DEDUPE_PIXEL_TOLERANCE = int(os.getenv("DEDUPE_PIXEL_TOLERANCE", "24"))
+
+_HASH_SIZE = 8
+_SAMPLE_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """
+    Orthonormal DCT-II basis, so a 2D DCT is two matrix products.
+    """
+
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+
+_DCT = _dct_matrix(_SAMPLE_SIZE)
+
+
+def perceptual_hash(data: bytes) -> int | None:
+    """
+    64-bit DCT perceptual hash of an encoded image: the sign of each of the
+    8x8 lowest-frequency coefficients of a 32x32 grayscale thumbnail,
+    relative to their median. Returns None if the image can't be decoded.
+    """
+
+    try:
+        img = Image.open(BytesIO(data))
+        img.draft("L", (_SAMPLE_SIZE, _SAMPLE_SIZE))
+        pixels = np.asarray(
+            img.convert("L").resize((_SAMPLE_SIZE, _SAMPLE_SIZE), Image.LANCZOS),
+            dtype=np.float64,
+        )
+    except Exception:
+        return None
+    low = (_DCT @ pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].ravel()
+    # the DC term only encodes overall brightness
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming_distances(hashes: list[int]) -> np.ndarray:
+    """
+    Pairwise Hamming distances between 64-bit hashes, as an n x n matrix.
+    """
+
+    h = np.array(hashes, dtype=np.uint64)
+    xor = h[:, None] ^ h[None, :]
+    return np.unpackbits(xor.view(np.uint8).reshape(len(h), len(h), 8), axis=-1).sum(axis=-1)
+
+
+def group_near_duplicates(hashes: list[int | None], max_distance: int = DEDUPE_MAX_DISTANCE) -> list[int]:
+    """
+    Maps every image to the index of its group's representative, the first
+    image of the group in upload order. Images without a hash form their own
+    group.
+    """
+
+    representative = list(range(len(hashes)))
+    hashed = [i for i, h in enumerate(hashes) if h is not None]
+    if max_distance < 0 or len(hashed) < 2:
+        return representative
+
+    close = hamming_distances([hashes[i] for i in hashed]) <= max_distance
+    assigned = np.zeros(len(hashed), dtype=bool)
+    for a in range(len(hashed)):
+        if assigned[a]:
+            continue
+        members = np.flatnonzero(close[a] & ~assigned)
+        assigned[members] = True
+        for b in members:
+            representative[hashed[b]] = hashed[a]
+    return representative
+
+
+def same_pixels(a: bytes, b: bytes, tolerance: int = DEDUPE_PIXEL_TOLERANCE) -> bool:
+    """
+    True if two encoded images have the same size and no grayscale pixel
+    differs by more than tolerance. Blocking, run it in a thread.
+    """
+
+    try:
+        with Image.open(BytesIO(a)) as img_a, Image.open(BytesIO(b)) as img_b:
+            if img_a.size != img_b.size:
+                return False
+            pixels_a = np.asarray(img_a.convert("L"), dtype=np.int16)
+            pixels_b = np.asarray(img_b.convert("L"), dtype=np.int16)
+    except Exception:
+        return False
+    return int(np.abs(pixels_a - pixels_b).max(initial=0)) <= tolerance
+
+
+def confirm_duplicates(representative: list[int], images: list[bytes]) -> list[int]:
+    """
+    Drops from group_near_duplicates' result every member whose pixels don't
+    match its representative's (same_pixels); those go to the model alone.
+    Blocking, run it in a thread.
+    """
+
+    return [
+        rep if rep == i or same_pixels(images[rep], images[i]) else i
+        for i, rep in enumerate(representative)
+    ]
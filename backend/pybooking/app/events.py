@@ -0,0 +1,49 @@
+import json
+
+import orjson
+from pydantic import TypeAdapter, ValidationError
+
+from app.models.models import ScreenshotResult, StreamEvent
+
+_STREAM_EVENT = TypeAdapter(StreamEvent)
+_SCREENSHOT = TypeAdapter(ScreenshotResult)
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def serialize_event(event_type: str, payload: dict) -> bytes:
+    """
+    Serializes an SSE event straight to bytes.
+    """
+
+    event = {"type": event_type, "payload": payload}
+    try:
+        body = orjson.dumps(event, default=str, option=_ORJSON_OPTIONS)
+    except TypeError:
+        # e.g. integers beyond 64 bits, which orjson refuses
+        body = json.dumps(event, default=str).encode("utf-8")
+    return b"data: " + body + b"\n\n"
+
+
+# Frames whose content never changes are encoded once.
+NO_IMAGES_RECEIVED = serialize_event("progress", {"message": "no_images_received"})
+JOINED_INFLIGHT_RUN = serialize_event("progress", {"message": "joined_inflight_run"})
+
+
+def validate_event(raw_event: dict) -> ScreenshotResult | None:
+    """
+    Validates a structured LLM event with a single validator call and returns
+    the parsed screenshot for extraction events.
+
+    Raises ValidationError when the event envelope is invalid. An extraction
+    whose screenshot does not validate is still a valid event; it just yields
+    no screenshot.
+    """
+
+    if raw_event.get("type") == "extraction" and isinstance(raw_event.get("payload"), dict):
+        try:
+            return _SCREENSHOT.validate_python(raw_event["payload"]["screenshot"])
+        except (KeyError, ValidationError):
+            return None
+    _STREAM_EVENT.validate_python(raw_event)
+    return None
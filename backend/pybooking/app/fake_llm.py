@@ -0,0 +1,142 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app.compare_fields import compare_fields
+from app.models.models import ScreenshotResult
+
+
+class FakeResponse:
+    """
+    Mimics the parts of genai's GenerateContentResponse the app reads.
+    """
+
+    def __init__(self, text: str, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeModels:
+    def __init__(self, client: "FakeGeminiClient"):
+        self._client = client
+
+    async def generate_content(self, *, model: str, contents: list, config=None) -> FakeResponse:
+        self._client.calls += 1
+        await asyncio.sleep(self._client.latency)
+        sid = screenshot_ids(contents)[0]
+        return FakeResponse(json.dumps(self._client.screenshot_for(sid)))
+
+    async def generate_content_stream(self, *, model: str, contents: list, config=None):
+        self._client.calls += 1
+        ids = screenshot_ids(contents)
+        # a response schema means llm_stream_structured: a JSON array of screenshots
+        if getattr(config, "response_schema", None) is not None:
+            text = json.dumps([self._client.screenshot_for(sid) for sid in ids], indent=2)
+        else:
+            text = self._client.ndjson_for(ids)
+        chunk_size = self._client.chunk_size
+
+        async def chunks():
+            # like the SDK, which sends the request on the first iteration
+            cached_tokens = self._client.aio.caches.lookup(getattr(config, "cached_content", None))
+            for start in range(0, len(text), chunk_size):
+                await asyncio.sleep(self._client.latency)
+                last = start + chunk_size >= len(text)
+                usage = SimpleNamespace(cached_content_token_count=cached_tokens) if last and cached_tokens else None
+                yield FakeResponse(text[start:start + chunk_size], usage)
+
+        return chunks()
+
+
+class FakeCaches:
+    """
+    Cached contents kept in memory. Their token count is a rough len / 4.
+    """
+
+    def __init__(self):
+        self.entries: dict[str, int] = {}
+        self.created = 0
+
+    async def create(self, *, model: str, config) -> SimpleNamespace:
+        self.created += 1
+        name = f"cachedContents/fake-{self.created}"
+        texts = [part.text or "" for content in config.contents for part in content.parts]
+        self.entries[name] = sum(len(text) for text in texts) // 4
+        return SimpleNamespace(name=name, usage_metadata=SimpleNamespace(total_token_count=self.entries[name]))
+
+    async def delete(self, *, name: str) -> None:
+        self.entries.pop(name, None)
+
+    def lookup(self, name: str | None) -> int:
+        """
+        Tokens of the named cached content, 0 without one; raises like the
+        API for a name it doesn't know.
+        """
+
+        if name is None:
+            return 0
+        if name not in self.entries:
+            raise FakeAPIError(403, f"CachedContent not found (or permission denied): {name}")
+        return self.entries[name]
+
+
+class FakeAio:
+    def __init__(self, client: "FakeGeminiClient"):
+        self.models = FakeModels(client)
+        self.caches = FakeCaches()
+
+    async def aclose(self) -> None:
+        pass
+
+
+class FakeGeminiClient:
+    """
+    Offline stand-in for genai.Client, selected with LLM_BACKEND=fake.
+
+    Screenshots whose id contains "final" are classified as the final booking,
+    all others as the initial quote. Every screenshot carries the same
+    booking details, so a full upload validates as a match.
+    """
+
+    def __init__(self, latency: float = 0.01, chunk_size: int = 64):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.aio = FakeAio(self)
+
+    def screenshot_for(self, sid: str) -> dict:
+        return {
+            "screenshot_id": sid,
+            "classification": "final_booking" if "final" in sid.lower() else "initial_quote",
+            "extraction": {
+                "hotel_name": "Hotel Example",
+                "check_in": "2025-06-01",
+                "check_out": "2025-06-05",
+                "guests": 2,
+                "total_price": 480.0,
+            },
+        }
+
+    def ndjson_for(self, ids: list[str]) -> str:
+        screenshots = [self.screenshot_for(sid) for sid in ids]
+        events = [{"type": "extraction", "payload": {"screenshot": s}} for s in screenshots]
+        comparisons = compare_fields([ScreenshotResult.model_validate(s) for s in screenshots])
+        events += [{"type": "comparison", "payload": c.model_dump(mode="json")} for c in comparisons]
+        overall = "match" if all(c.status == "match" for c in comparisons) else "unclear"
+        events.append({"type": "final", "payload": {"summary": {"overall": overall, "detail": "fake"}}})
+        return "".join(json.dumps(ev) + "\n" for ev in events)
+
+
+def screenshot_ids(contents: list) -> list[str]:
+    ids = []
+    for part in contents:
+        text = getattr(part, "text", None) or ""
+        if text.startswith("SCREENSHOT_ID:"):
+            ids.append(text[len("SCREENSHOT_ID:"):])
+    return ids
@@ -0,0 +1,201 @@
+import asyncio
+import functools
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+
+from app.metrics import INSTRUCTION_CACHE_LOOKUPS
+
+# "0" always sends the prompts inline.
+INSTRUCTION_CACHE_ENABLED = os.getenv("INSTRUCTION_CACHE", "1") != "0"
+INSTRUCTION_CACHE_TTL_SECONDS = int(os.getenv("INSTRUCTION_CACHE_TTL_SECONDS", "3600"))
+# After a failed create (e.g. a tier without caching) the prompt goes inline
+# this long before retrying.
+INSTRUCTION_CACHE_RETRY_SECONDS = float(os.getenv("INSTRUCTION_CACHE_RETRY_SECONDS", "300"))
+# Handles this close to expiry are replaced rather than used.
+REFRESH_MARGIN_SECONDS = 60.0
+# Smallest prompt Gemini accepts as cached content, by model name prefix;
+# INSTRUCTION_CACHE_MIN_TOKENS overrides it for every model.
+MIN_CACHE_TOKENS = {"gemini-2.5-pro": 4096, "gemini-2.5-flash": 1024}
+DEFAULT_MIN_CACHE_TOKENS = 4096
+INSTRUCTION_CACHE_MIN_TOKENS = os.getenv("INSTRUCTION_CACHE_MIN_TOKENS")
+# English prompts run about 4 characters per token, so 3 overestimates the
+# count: only prompts clearly below the minimum are skipped.
+_CHARS_PER_TOKEN = 3
+
+
+def min_cache_tokens(model: str) -> int:
+    if INSTRUCTION_CACHE_MIN_TOKENS is not None:
+        return int(INSTRUCTION_CACHE_MIN_TOKENS)
+    for prefix, tokens in MIN_CACHE_TOKENS.items():
+        if model.startswith(prefix):
+            return tokens
+    return DEFAULT_MIN_CACHE_TOKENS
+
+
+@functools.lru_cache(maxsize=64)
+def cacheable(model: str, texts: tuple[str, ...]) -> bool:
+    """
+    False for a prompt too short for the model to cache; creating it would
+    only ever fail.
+    """
+
+    return sum(len(text) for text in texts) / _CHARS_PER_TOKEN >= min_cache_tokens(model)
+
+
+@functools.lru_cache(maxsize=64)
+def prompt_hash(model: str, texts: tuple[str, ...]) -> str:
+    h = hashlib.sha256(model.encode())
+    for text in texts:
+        h.update(b"\0")
+        h.update(text.encode())
+    return h.hexdigest()
+
+
+@dataclass
+class CachedPrefix:
+    name: str
+    prompt_hash: str
+    expires_at: float  # time.monotonic()
+    tokens: int
+
+
+class InstructionCache:
+    """
+    Registers each static prompt prefix once as cached content on the model
+    side (client.aio.caches, which the offline FakeGeminiClient implements
+    too) and hands out its name, so requests only send the images.
+
+    Handles are kept per client, model and prompt kind. One is recreated when
+    it is about to expire or when the prompt text it was made from changes.
+    Creating happens in the background: requests never wait for it and send
+    the prompt inline until a handle exists. Prompts below the model's
+    minimum size are never cached, and after a failed create the prompt goes
+    inline for retry_seconds.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = INSTRUCTION_CACHE_ENABLED,
+        ttl_seconds: int = INSTRUCTION_CACHE_TTL_SECONDS,
+        retry_seconds: float = INSTRUCTION_CACHE_RETRY_SECONDS,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self._handles: dict[tuple, CachedPrefix] = {}
+        self._failed_until: dict[tuple, float] = {}
+        self._creating: dict[tuple, asyncio.Task] = {}
+        self.last_error: str | None = None
+
+    def get(self, client, model: str, kind: str, texts: tuple[str, ...]) -> CachedPrefix | None:
+        """
+        A live handle for the prompt texts of kind on model, or None if the
+        prompt has to be sent inline; a missing or stale handle is then
+        (re)created in the background.
+        """
+
+        if not self.enabled or client is None:
+            return None
+        if not cacheable(model, texts):
+            INSTRUCTION_CACHE_LOOKUPS.labels("below_minimum").inc()
+            return None
+        key = (id(client), model, kind)
+        digest = prompt_hash(model, texts)
+        handle = self._handles.get(key)
+        if self._usable(handle, digest):
+            INSTRUCTION_CACHE_LOOKUPS.labels("hit").inc()
+            return handle
+        if time.monotonic() < self._failed_until.get(key, 0.0):
+            INSTRUCTION_CACHE_LOOKUPS.labels("unavailable").inc()
+            return None
+        INSTRUCTION_CACHE_LOOKUPS.labels("miss").inc()
+        if key not in self._creating:
+            self._creating[key] = asyncio.create_task(self._replace(client, key, kind, texts, digest))
+        return None
+
+    async def ensure(self, client, model: str, kind: str, texts: tuple[str, ...]) -> CachedPrefix | None:
+        """
+        Like get(), but waits for a handle being created; for warm-up.
+        """
+
+        handle = self.get(client, model, kind, texts)
+        task = self._creating.get((id(client), model, kind))
+        if handle is None and task is not None:
+            await asyncio.shield(task)
+            handle = self._handles.get((id(client), model, kind))
+        return handle
+
+    def invalidate(self, client, handle: CachedPrefix) -> None:
+        """
+        Forgets a handle the model no longer knows, so the next get() recreates it.
+        """
+
+        for key, cached in list(self._handles.items()):
+            if key[0] == id(client) and cached is handle:
+                del self._handles[key]
+
+    async def close(self, client) -> None:
+        """
+        Deletes the client's handles instead of leaving them to their TTL.
+        """
+
+        creating = [task for key, task in self._creating.items() if key[0] == id(client)]
+        await asyncio.gather(*creating, return_exceptions=True)
+        for key in [key for key in self._handles if key[0] == id(client)]:
+            await self._delete(client, self._handles.pop(key).name)
+
+    def _usable(self, handle: CachedPrefix | None, digest: str) -> bool:
+        return (
+            handle is not None
+            and handle.prompt_hash == digest
+            and handle.expires_at - time.monotonic() > REFRESH_MARGIN_SECONDS
+        )
+
+    async def _replace(self, client, key: tuple, kind: str, texts: tuple[str, ...], digest: str) -> None:
+        model = key[1]
+        try:
+            fresh = await self._create(client, model, kind, texts, digest)
+        except Exception as exc:
+            self.last_error = str(exc) or type(exc).__name__
+            self._failed_until[key] = time.monotonic() + self.retry_seconds
+            return
+        finally:
+            self._creating.pop(key, None)
+        old = self._handles.get(key)
+        self._handles[key] = fresh
+        self._failed_until.pop(key, None)
+        if old is not None:
+            # replaced early or for a changed prompt; don't pay for it until its TTL
+            await self._delete(client, old.name)
+
+    async def _create(self, client, model: str, kind: str, texts: tuple[str, ...], digest: str) -> CachedPrefix:
+        from google.genai import types  # deferred, like app.llm_client
+
+        created_at = time.monotonic()
+        cached = await client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name=f"booking-validator-{kind}-{digest[:12]}",
+                contents=[types.Content(role="user", parts=[types.Part.from_text(text=text) for text in texts])],
+                ttl=f"{self.ttl_seconds}s",
+            ),
+        )
+        usage = getattr(cached, "usage_metadata", None)
+        return CachedPrefix(
+            name=cached.name,
+            prompt_hash=digest,
+            expires_at=created_at + self.ttl_seconds,
+            tokens=getattr(usage, "total_token_count", None) or 0,
+        )
+
+    @staticmethod
+    async def _delete(client, name: str) -> None:
+        try:
+            await client.aio.caches.delete(name=name)
+        except Exception:
+            pass
+
+
+instruction_cache = InstructionCache()
@@ -1,104 +1,231 @@
+from __future__ import annotations
+
+import functools
+import importlib
 import json
+import os
 import asyncio
+import time
 import traceback
-from io import BytesIO
-from PIL import Image
-from google import genai
-from google.genai import types
+from contextlib import aclosing
+from typing import TYPE_CHECKING, Awaitable, Callable
 from dotenv import load_dotenv
 
+from app.compare_fields import conflicting_screenshots
+from app.instruction_cache import cacheable, instruction_cache
+from app.metrics import (
+    ESCALATIONS,
+    INSTRUCTION_CACHE_TOKENS,
+    LLM_LINES,
+    STAGE_SECONDS,
+    TIER_REQUESTS,
+    TIER_SECONDS,
+    TIER_TOKENS,
+    StageTimings,
+)
+from app.models.models import ScreenshotResult
+from app.ndjson import JSONArrayDecoder, NDJSONDecoder
+from app.preprocess import MAX_SAFE_BYTES, preprocess_images
+from app.scheduler import AdmissionError
+
+
+class _LazyModule:
+    """
+    Imports a module on first attribute access. google.genai takes a few
+    hundred ms to import, which the app's warm-up pays off the request path.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
+else:
+    genai = _LazyModule("google.genai")
+    types = _LazyModule("google.genai.types")
+
 load_dotenv()
 
 MODEL = "gemini-2.5-flash"
+# Cheaper tier tried first in per_screenshot mode; empty disables routing.
+FAST_MODEL = os.getenv("LLM_FAST_MODEL", "gemini-2.5-flash-lite")
+# "fake" swaps Gemini for the offline stand-in in app/fake_llm.py
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", "4"))
+
+
+# --- Prompts (constant; their Parts are built once, see prompt_parts) ---
+
+EXTRACTION_INSTRUCTION = (
+    "SYSTEM: You extract booking details from ONE screenshot. "
+    "Output ONLY one JSON object, no prose and no markdown, with this schema: "
+    "{ screenshot_id, classification (initial_quote|final_booking|unknown), "
+    "extraction:{ hotel_name, check_in, check_out, guests, total_price }}. "
+    "initial_quote is a price quote or offer shown before booking; final_booking is a "
+    "booking confirmation. Dates use YYYY-MM-DD, guests is an integer and total_price a number. "
+    "Use the string 'unclear' for any field that is not confidently visible."
+)
+
+BATCH_SYSTEM_INSTRUCTION = (
+    "SYSTEM: You MUST output only newline-delimited JSON objects, one JSON per line. "
+    "You MUST emit events in this exact order: extraction → comparison → final. "
+    "The FINAL event is REQUIRED and MUST be the last event. "
+    "Allowed event types: 'progress', 'extraction', 'comparison', 'final'. "
+
+    "Extraction events schema: "
+    "{ type:'extraction', payload:{ screenshot:{ screenshot_id, classification "
+    "(initial_quote|final_booking|unknown), extraction:{ hotel_name, check_in, "
+    "check_out, guests, total_price }}}}. "
+    "Use the string 'unclear' for any field that is not confidently visible. "
+
+    "Comparison events schema: "
+    "{ type:'comparison', payload:{ field "
+    "(hotel_name|check_in|check_out|guests|total_price), initial_value, final_value, "
+    "status(match|mismatch|unclear), explanation, evidence:[screenshot_id] }}. "
+
+    "Final event schema (REQUIRED): "
+    "{ type:'final', payload:{ summary:{ overall(match|mismatch|unclear), detail }}}. "
+
+    "Rules: "
+    "• Emit one extraction event per screenshot immediately after processing it. "
+    "• Emit exactly one comparison per field. "
+    "• After ALL comparisons, emit EXACTLY ONE final event. "
+    "• NEVER omit the final event. "
+    "• NEVER output anything except valid JSON lines."
+)
+
+BATCH_USER_PROMPT = (
+    "Task: Verify whether booking information in the final booking matches the initial quote. "
+
+    "Process instructions: "
+    "1) For EACH screenshot, emit one extraction event immediately. "
+    "2) After all extractions, emit comparison events for these fields in order: "
+    "hotel_name, check_in, check_out, guests, total_price. "
+    "3) After ALL comparisons, you MUST emit one final event summarizing the result. "
+
+    "Final event instructions: "
+    "• overall = 'match' ONLY if ALL fields are 'match'. "
+    "• overall = 'mismatch' if ANY field is 'mismatch'. "
+    "• overall = 'unclear' otherwise. "
+    "• detail must be a short human-readable summary explaining the decision. "
+
+    "Output constraints: "
+    "• Output ONLY newline-delimited JSON objects. "
+    "• Do NOT explain your reasoning outside JSON. "
+    "• Do NOT stop early. The final event is REQUIRED."
+)
+
+STRUCTURED_PROMPT = (
+    "Extract the booking details from each screenshot, one array element per screenshot, "
+    "using the SCREENSHOT_ID that follows it. initial_quote is a price quote or offer shown "
+    "before booking; final_booking is a booking confirmation. Dates use YYYY-MM-DD. "
+    "Use the string 'unclear' for any field that is not confidently visible."
+)
+
+_PROMPTS = {
+    "extract_one": (EXTRACTION_INSTRUCTION,),
+    "batch": (BATCH_SYSTEM_INSTRUCTION, BATCH_USER_PROMPT),
+    "structured": (STRUCTURED_PROMPT,),
+}
+
+
+@functools.cache
+def prompt_parts(kind: str) -> tuple[types.Part, ...]:
+    """
+    The prompt Parts for one kind of request, built on first use and then
+    shared by every request.
+    """
+
+    return tuple(types.Part.from_text(text=text) for text in _PROMPTS[kind])
+
+
+@functools.lru_cache(maxsize=16)
+def _generation_config(kind: str, cached_content: str | None = None) -> types.GenerateContentConfig | None:
+    settings = {}
+    if kind == "structured":
+        settings.update(response_mime_type="application/json", response_schema=list[ScreenshotResult])
+    if cached_content:
+        settings["cached_content"] = cached_content
+    return types.GenerateContentConfig(**settings) if settings else None
+
+
+def build_prompt_parts() -> None:
+    """
+    Builds every cached prompt Part and request config ahead of the first request.
+    """
+
+    for kind in _PROMPTS:
+        prompt_parts(kind)
+    _generation_config("structured")
+
+
+async def prime_instruction_cache(client) -> bool:
+    """
+    Creates the cached prompt prefixes ahead of the first request. Returns
+    False when there is nothing to do, including when every prompt is below
+    the model's minimum cache size; raises if no prefix could be cached.
+    """
+
+    if client is None or not instruction_cache.enabled:
+        return False
+    # the kinds sent through _stream_objects; extract_one's prompt is far too short to cache
+    kinds = [kind for kind in ("batch", "structured") if cacheable(MODEL, _PROMPTS[kind])]
+    if not kinds:
+        return False
+    handles = [await instruction_cache.ensure(client, MODEL, kind, _PROMPTS[kind]) for kind in kinds]
+    if not any(handles):
+        raise RuntimeError(instruction_cache.last_error or "instruction cache unavailable")
+    return True
+
 
-def _compress_image(orig_bytes: bytes, max_width: int = 800, quality: int = 60) -> bytes:
+def create_client():
     """
-    Resize + compress image to keep payload small. Returns JPEG bytes.
+    Builds the LLM client shared by all requests for the app's lifetime.
     """
 
+    if LLM_BACKEND == "fake":
+        from app.fake_llm import FakeGeminiClient
+        return FakeGeminiClient()
+    return genai.Client()
+
+
+async def close_client(client) -> None:
     try:
-        img = Image.open(BytesIO(orig_bytes)).convert("RGB")
+        await client.aio.aclose()
     except Exception:
-        # If PIL can't open, return original bytes
-        return orig_bytes
+        pass
+
+
+def _screenshot_id(filenames: list[str] | None, idx: int) -> str:
+    return filenames[idx] if filenames and idx < len(filenames) else f"img_{idx+1}"
 
-    w, h = img.size
-    if w > max_width:
-        new_h = int(h * (max_width / w))
-        img = img.resize((max_width, new_h), Image.LANCZOS)
-    out = BytesIO()
-    img.save(out, format="JPEG", quality=quality)
-    return out.getvalue()
 
-async def llm_stream(image_bytes_list: list[bytes], filenames: list[str] | None = None, context_text: str | None = None):
+async def _prepare_images(
+    image_bytes_list: list[bytes],
+    filenames: list[str] | None,
+    preprocessed: bool = False,
+) -> list[tuple[str, types.Part]]:
     """
-    Async generator: yields parsed JSON event dicts from Gemini streaming output.
+    Compresses all images concurrently off the event loop (unless the caller
+    already did) and returns (screenshot_id, image part) pairs in input order.
     """
 
-    system_instruction = (
-        "SYSTEM: You MUST output only newline-delimited JSON objects, one JSON per line. "
-        "You MUST emit events in this exact order: extraction → comparison → final. "
-        "The FINAL event is REQUIRED and MUST be the last event. "
-        "Allowed event types: 'progress', 'extraction', 'comparison', 'final'. "
-
-        "Extraction events schema: "
-        "{ type:'extraction', payload:{ screenshot:{ screenshot_id, classification "
-        "(initial_quote|final_booking|unknown), extraction:{ hotel_name, check_in, "
-        "check_out, guests, total_price }}}}. "
-        "Use the string 'unclear' for any field that is not confidently visible. "
-
-        "Comparison events schema: "
-        "{ type:'comparison', payload:{ field "
-        "(hotel_name|check_in|check_out|guests|total_price), initial_value, final_value, "
-        "status(match|mismatch|unclear), explanation, evidence:[screenshot_id] }}. "
-
-        "Final event schema (REQUIRED): "
-        "{ type:'final', payload:{ summary:{ overall(match|mismatch|unclear), detail }}}. "
-
-        "Rules: "
-        "• Emit one extraction event per screenshot immediately after processing it. "
-        "• Emit exactly one comparison per field. "
-        "• After ALL comparisons, emit EXACTLY ONE final event. "
-        "• NEVER omit the final event. "
-        "• NEVER output anything except valid JSON lines."
-    )
-
-    user_prompt = (
-        "Task: Verify whether booking information in the final booking matches the initial quote. "
-
-        "Process instructions: "
-        "1) For EACH screenshot, emit one extraction event immediately. "
-        "2) After all extractions, emit comparison events for these fields in order: "
-        "hotel_name, check_in, check_out, guests, total_price. "
-        "3) After ALL comparisons, you MUST emit one final event summarizing the result. "
-
-        "Final event instructions: "
-        "• overall = 'match' ONLY if ALL fields are 'match'. "
-        "• overall = 'mismatch' if ANY field is 'mismatch'. "
-        "• overall = 'unclear' otherwise. "
-        "• detail must be a short human-readable summary explaining the decision. "
-
-        "Output constraints: "
-        "• Output ONLY newline-delimited JSON objects. "
-        "• Do NOT explain your reasoning outside JSON. "
-        "• Do NOT stop early. The final event is REQUIRED."
-    )
+    try:
+        processed = image_bytes_list if preprocessed else await preprocess_images(image_bytes_list)
+    except Exception as e:
+        raise RuntimeError(f"Failed preparing images: {str(e)}") from e
 
-    # Prepare contents (text + images). We'll compress, and if any image stays too large we'll abort with a clear event.
-    contents = [
-        types.Part.from_text(text=system_instruction),
-        types.Part.from_text(text=user_prompt),
-    ]
-    MAX_SAFE_BYTES = 2_400_000  # 2.4 MB safe threshold
-
-    # compress and attach images
-    for idx, raw in enumerate(image_bytes_list):
+    parts = []
+    for idx, proc in enumerate(processed):
         try:
-            # first pass compress
-            proc = _compress_image(raw, max_width=800, quality=60)
-            # if still large, try stronger compression
-            if len(proc) > MAX_SAFE_BYTES:
-                proc = _compress_image(raw, max_width=600, quality=45)
             # final size check
             if len(proc) > MAX_SAFE_BYTES:
                 raise ValueError(
@@ -106,87 +233,358 @@ async def llm_stream(image_bytes_list: list[bytes], filenames: list[str] | None
                     f"is too large after compression ({len(proc)} bytes). Reduce resolution or remove."
                 )
             # note: use keyword args for from_bytes
-            contents.append(types.Part.from_bytes(data=proc, mime_type="image/jpeg"))
+            parts.append((_screenshot_id(filenames, idx), types.Part.from_bytes(data=proc, mime_type="image/jpeg")))
         except Exception as e:
             raise RuntimeError(f"Failed preparing image {idx}: {str(e)}") from e
+    return parts
 
-        # label with filename so the model sees the file order
-        sid = filenames[idx] if filenames and idx < len(filenames) else f"img_{idx+1}"
-        contents.append(types.Part.from_text(text=f"SCREENSHOT_ID:{sid}"))
 
-    if context_text:
-        contents.append(types.Part.from_text(text=f"Context: {context_text}"))
+def _parse_json_object(text: str) -> dict:
+    """
+    Parses a single JSON object from model output, tolerating markdown code fences.
+    """
+
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("{"):]
+    start, end = text.find("{"), text.rfind("}")
+    obj = json.loads(text[start:end + 1] if start != -1 else text)
+    if not isinstance(obj, dict):
+        raise ValueError("expected a JSON object")
+    return obj
+
+
+async def llm_extract_each(
+    image_bytes_list: list[bytes],
+    filenames: list[str] | None = None,
+    context_text: str | None = None,
+    concurrency: int = EXTRACTION_CONCURRENCY,
+    client: genai.Client | None = None,
+    preprocessed: bool = False,
+    timings: StageTimings | None = None,
+    model: str = MODEL,
+):
+    """
+    Async generator: sends one extraction request per screenshot, at most
+    `concurrency` at a time, and yields each 'extraction' event as soon as its
+    request finishes. Per-screenshot failures are yielded as 'progress' events.
+    """
+
+    if client is None:
+        yield {"type": "progress", "payload": {"message": "LLM error: client unavailable", "error": "client unavailable"}}
+        return
+
+    timings = timings or StageTimings()
+    prepared = await _prepare_images(image_bytes_list, filenames, preprocessed)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
 
-    # Async queue + background thread runner
-    q: asyncio.Queue = asyncio.Queue()
-    loop = asyncio.get_event_loop()
+    async def extract_one(sid: str, image_part: types.Part) -> dict:
+        contents = [
+            *prompt_parts("extract_one"),
+            image_part,
+            types.Part.from_text(text=f"SCREENSHOT_ID:{sid}"),
+        ]
+        if context_text:
+            contents.append(types.Part.from_text(text=f"Context: {context_text}"))
 
-    def run_stream_and_enqueue():
-        """
-        Background thread: runs blocking genai streaming and enqueues dict events into asyncio queue.
-        All exceptions are caught and enqueued as 'progress' events with tracebacks.
-        """
+        started = time.perf_counter()
+        TIER_REQUESTS.labels(model).inc()
         try:
-            client = genai.Client()
+            response = await client.aio.models.generate_content(model=model, contents=contents)
         except Exception as e:
-            payload = {"type": "progress", "payload": {"message": f"LLM error: {str(e)}", "error": str(e), "trace": traceback.format_exc()}}
-            asyncio.run_coroutine_threadsafe(q.put(payload), loop)
-            asyncio.run_coroutine_threadsafe(q.put({"type": "stream_end", "payload": {}}), loop)
-            return
+            return {"type": "progress", "payload": {"message": f"llm_extraction_error: {sid}", "error": str(e), "trace": traceback.format_exc()}}
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels("llm_call").observe(elapsed)
+        TIER_SECONDS.labels(model).observe(elapsed)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            TIER_TOKENS.labels(model, "input").inc(usage.prompt_token_count or 0)
+            TIER_TOKENS.labels(model, "output").inc(usage.candidates_token_count or 0)
 
-        buffer = ""
         try:
-            try:
-                stream = client.models.generate_content_stream(model=MODEL, contents=contents)
-            except Exception as e:
-                payload = {"type": "progress", "payload": {"message": "llm_start_error", "error": str(e), "trace": traceback.format_exc()}}
-                asyncio.run_coroutine_threadsafe(q.put(payload), loop)
-                asyncio.run_coroutine_threadsafe(q.put({"type": "stream_end", "payload": {}}), loop)
-                return
-
-            for chunk in stream:
-                txt = getattr(chunk, "text", None) or ""
-                if not txt:
-                    continue
-                buffer += txt
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    line = line.strip()
-                    if not line:
-                        continue
-                    if line == "[DONE]":
-                        continue
-                    try:
-                        ev = json.loads(line)
-                        asyncio.run_coroutine_threadsafe(q.put(ev), loop)
-                    except Exception:
-                        pass
-
-            # leftover buffer
-            if buffer.strip():
-                final_line = buffer.strip()
+            screenshot = _parse_json_object(response.text or "")
+        except Exception as e:
+            return {"type": "progress", "payload": {"message": f"invalid_extraction_output: {sid}", "error": str(e), "raw": response.text}}
+        # the id is ours, not the model's to choose
+        screenshot["screenshot_id"] = sid
+        return {"type": "extraction", "payload": {"screenshot": screenshot}}
+
+    # Results go through a bounded queue. A worker holds its semaphore slot
+    # until its result fits in the queue, so a slow or vanished consumer stops
+    # new upstream calls from starting.
+    results: asyncio.Queue = asyncio.Queue(maxsize=max(1, concurrency))
+
+    async def worker(sid: str, image_part: types.Part) -> None:
+        async with semaphore:
+            await results.put(await extract_one(sid, image_part))
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(worker(sid, part)) for sid, part in prepared]
+    try:
+        for n, _ in enumerate(tasks):
+            result = await results.get()
+            if n == 0:
+                timings.record("llm_first_token", time.perf_counter() - started)
+            yield result
+        timings.record("llm_total", time.perf_counter() - started)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def llm_extract_tiered(
+    image_bytes_list: list[bytes],
+    filenames: list[str] | None = None,
+    context_text: str | None = None,
+    client: genai.Client | None = None,
+    preprocessed: bool = False,
+    timings: StageTimings | None = None,
+    charge: Callable[[int], Awaitable[None]] | None = None,
+):
+    """
+    Async generator: llm_extract_each on FAST_MODEL, then again on MODEL for
+    the screenshots the fast tier got wrong or not at all: no valid result,
+    any 'unclear' field, or a value that conflicts with another screenshot
+    of the same kind. Escalated extractions are yielded after the fast ones
+    and replace them.
+
+    charge(n), e.g. Scheduler.charge, is awaited for the n escalation requests
+    before they are sent; if it raises AdmissionError the fast results stand.
+    """
+
+    prepared = await _prepare_images(image_bytes_list, filenames, preprocessed)
+    # the compressed bytes, so the second tier doesn't compress again
+    jpeg_by_id = {sid: part.inline_data.data for sid, part in prepared}
+    ids = list(jpeg_by_id)
+
+    results: dict[str, ScreenshotResult] = {}
+    async with aclosing(
+        llm_extract_each(
+            [jpeg_by_id[sid] for sid in ids], ids, context_text,
+            client=client, preprocessed=True, timings=timings, model=FAST_MODEL,
+        )
+    ) as events:
+        async for ev in events:
+            if ev["type"] == "extraction":
                 try:
-                    ev = json.loads(final_line)
-                    asyncio.run_coroutine_threadsafe(q.put(ev), loop)
+                    screenshot = ScreenshotResult.model_validate(ev["payload"]["screenshot"])
+                    results[screenshot.screenshot_id] = screenshot
                 except Exception:
                     pass
+            yield ev
+
+    if client is None:
+        return
+    reasons: dict[str, str] = {}
+    for sid in conflicting_screenshots(list(results.values())):
+        reasons[sid] = "conflict"
+    for sid in ids:
+        if sid not in results:
+            reasons[sid] = "missing"
+        elif any(v == "unclear" for v in results[sid].extraction.model_dump().values()):
+            reasons[sid] = "unclear"
+    if not reasons:
+        return
+
+    escalate = [sid for sid in ids if sid in reasons]
+    if charge is not None:
+        try:
+            await charge(len(escalate))
+        except AdmissionError as e:
+            yield {
+                "type": "progress",
+                "payload": {"message": "escalation_skipped", "reason": str(e), "screenshots": reasons},
+            }
+            return
+    for reason in reasons.values():
+        ESCALATIONS.labels(reason).inc()
+    yield {
+        "type": "progress",
+        "payload": {"message": "escalating_screenshots", "model": MODEL, "screenshots": reasons},
+    }
+    async with aclosing(
+        llm_extract_each(
+            [jpeg_by_id[sid] for sid in escalate], escalate, context_text,
+            client=client, preprocessed=True, timings=timings, model=MODEL,
+        )
+    ) as events:
+        async for ev in events:
+            yield ev
+
+
+async def llm_stream(
+    image_bytes_list: list[bytes],
+    filenames: list[str] | None = None,
+    context_text: str | None = None,
+    client: genai.Client | None = None,
+    preprocessed: bool = False,
+    timings: StageTimings | None = None,
+):
+    """
+    Async generator: yields parsed JSON event dicts from Gemini streaming output.
+    Uses the SDK's native async interface on the shared, app-lifetime client.
+    """
+
+    # Prepare contents (text + images). We'll compress, and if any image stays too large we'll abort with a clear event.
+    body = await _batch_contents(image_bytes_list, filenames, context_text, preprocessed)
+
+    async for ev in _stream_objects(client, "batch", body, NDJSONDecoder(), timings):
+        yield ev
+
+
+async def llm_stream_structured(
+    image_bytes_list: list[bytes],
+    filenames: list[str] | None = None,
+    context_text: str | None = None,
+    client: genai.Client | None = None,
+    preprocessed: bool = False,
+    timings: StageTimings | None = None,
+):
+    """
+    Async generator: like llm_stream, but Gemini's output is constrained to a
+    JSON array of ScreenshotResult by a response schema. Elements are parsed
+    as they stream in and yielded as 'extraction' events; comparisons and
+    the final verdict are left to the caller (compare_fields).
+    """
+
+    body = await _batch_contents(image_bytes_list, filenames, context_text, preprocessed)
 
+    async for obj in _stream_objects(client, "structured", body, JSONArrayDecoder(), timings):
+        if obj.get("type") == "progress":
+            yield obj
+        else:
+            yield {"type": "extraction", "payload": {"screenshot": obj}}
+
+
+async def _batch_contents(
+    image_bytes_list: list[bytes],
+    filenames: list[str] | None,
+    context_text: str | None,
+    preprocessed: bool,
+) -> list[types.Part]:
+    """
+    The request after the prompt: each image followed by its SCREENSHOT_ID
+    label, then the optional user context.
+    """
+
+    contents = []
+
+    for sid, image_part in await _prepare_images(image_bytes_list, filenames, preprocessed):
+        contents.append(image_part)
+        # label with filename so the model sees the file order
+        contents.append(types.Part.from_text(text=f"SCREENSHOT_ID:{sid}"))
+
+    if context_text:
+        contents.append(types.Part.from_text(text=f"Context: {context_text}"))
+    return contents
+
+
+async def _generate_stream(client: genai.Client, kind: str, body: list[types.Part]):
+    """
+    Starts a streamed generation of the kind's prompt followed by body. The
+    prompt is referenced from the instruction cache when it has a handle and
+    sent inline otherwise, including when the model no longer knows the handle.
+    """
+
+    prefix = instruction_cache.get(client, MODEL, kind, _PROMPTS[kind])
+    if prefix is not None:
+        stream = await client.aio.models.generate_content_stream(
+            model=MODEL, contents=body, config=_generation_config(kind, prefix.name)
+        )
+        # the request is only sent on the first iteration, so that's where an
+        # unknown handle fails
+        try:
+            first = await anext(stream)
+        except StopAsyncIteration:
+            return stream
         except Exception as e:
-            # enqueue exception trace
-            asyncio.run_coroutine_threadsafe(q.put({"type": "progress", "payload": {"message": f"LLM stream error: {str(e.message)}", "error": str(e), "trace": traceback.format_exc()}}), loop)
-        finally:
-            asyncio.run_coroutine_threadsafe(q.put({"type": "stream_end", "payload": {}}), loop)
+            await _aclose(stream)
+            # expired or deleted server-side: 403/404; anything else is a real error
+            if getattr(e, "code", None) not in (403, 404):
+                raise
+            instruction_cache.invalidate(client, prefix)
+        else:
+            return _prepend(first, stream)
+    return await client.aio.models.generate_content_stream(
+        model=MODEL, contents=[*prompt_parts(kind), *body], config=_generation_config(kind)
+    )
+
+
+async def _prepend(first, stream):
+    try:
+        yield first
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await _aclose(stream)
+
+
+async def _aclose(stream) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
 
-    # run the blocking streaming in a background thread
-    thread_task = loop.run_in_executor(None, run_stream_and_enqueue)
+async def _stream_objects(
+    client: genai.Client | None,
+    kind: str,
+    body: list[types.Part],
+    decoder: NDJSONDecoder,
+    timings: StageTimings | None,
+):
+    """
+    Streams one generation of the kind's prompt plus body and yields the JSON
+    objects `decoder` recovers from it, plus 'progress' events for errors and
+    malformed output.
+    """
+
+    if client is None:
+        yield {"type": "progress", "payload": {"message": "LLM error: client unavailable", "error": "client unavailable"}}
+        return
+
+    timings = timings or StageTimings()
+    started = time.perf_counter()
+    try:
+        stream = await _generate_stream(client, kind, body)
+    except Exception as e:
+        yield {"type": "progress", "payload": {"message": "llm_start_error", "error": str(e), "trace": traceback.format_exc()}}
+        return
 
+    first_chunk = True
+    parse_seconds = 0.0
+    usage = None
     try:
-        while True:
-            ev = await q.get()
-            if not isinstance(ev, dict):
+        async for chunk in stream:
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            txt = getattr(chunk, "text", None) or ""
+            if not txt:
                 continue
-            if ev.get("type") == "stream_end":
-                break
+            if first_chunk:
+                timings.record("llm_first_token", time.perf_counter() - started)
+                first_chunk = False
+            parse_start = time.perf_counter()
+            events = decoder.feed(txt)
+            parse_seconds += time.perf_counter() - parse_start
+            for ev in events:
+                yield ev
+
+        for ev in decoder.close():
             yield ev
+        timings.record("llm_total", time.perf_counter() - started)
+
+    except Exception as e:
+        yield {"type": "progress", "payload": {"message": f"LLM stream error: {str(e)}", "error": str(e), "trace": traceback.format_exc()}}
     finally:
-        await thread_task
+        # Runs on normal completion and when the consumer closes us early
+        # (client disconnect): release the upstream HTTP stream right away.
+        await _aclose(stream)
+        timings.record("ndjson_parse", parse_seconds)
+        if usage is not None:
+            INSTRUCTION_CACHE_TOKENS.inc(getattr(usage, "cached_content_token_count", None) or 0)
+        LLM_LINES.labels("parsed").inc(decoder.objects)
+        LLM_LINES.labels("malformed").inc(decoder.malformed)
+
+    if decoder.malformed:
+        yield {"type": "progress", "payload": {"message": "llm_malformed_output", **decoder.diagnostics}}
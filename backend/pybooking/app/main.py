@@ -1,13 +1,51 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import stream
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.batch import BATCH_MAX_REQUEST_BYTES
+from app.metrics import ACTIVE_LLM_REQUESTS, QUEUE_DEPTH
+from app.preprocess import shutdown_pool
+from app.scheduler import Scheduler
+from app.singleflight import SingleFlight
+from app.store import create_store
+from app.uploads import RequestSizeLimit
+from app.warmup import Warmup
+from app.routes import batch, history, stream
 
 import os
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One model client for every request, so HTTP connections are reused. It
+    # is created in the background with the rest of the warm-up; requests
+    # arriving earlier wait for it (app.warmup.llm_client).
+    app.state.warmup = Warmup(app)
+    app.state.warmup.start()
+    app.state.scheduler = Scheduler()
+    QUEUE_DEPTH.set_function(lambda: app.state.scheduler.queue_depth)
+    ACTIVE_LLM_REQUESTS.set_function(lambda: app.state.scheduler.active)
+    app.state.inflight = SingleFlight()
+    # One connection pool per worker; the database itself is shared.
+    app.state.store = create_store()
+    if app.state.store is not None:
+        await app.state.store.start()
+    yield
+    if app.state.store is not None:
+        await app.state.store.close()
+    await app.state.warmup.stop()
+    shutdown_pool()
+
+
 app = FastAPI(
     title="Booking Confirmation Validator",
+    lifespan=lifespan,
 )
 
+app.add_middleware(RequestSizeLimit)
+app.add_middleware(RequestSizeLimit, path="/batch", max_bytes=BATCH_MAX_REQUEST_BYTES)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[os.getenv("FRONTEND_URL")],
@@ -16,10 +54,32 @@ app.add_middleware(
 )
 
 app.include_router(stream.router, tags=["Stream"])
+app.include_router(batch.router, tags=["Batch"])
+app.include_router(history.router, tags=["History"])
+@app.get("/utils/live")
 @app.get("/utils/health-check")
-def health_check():
+def liveness():
+    """
+    The process is up and serving; says nothing about warm-up.
+    """
+
     return {"status": "ok"}
 
+
+@app.get("/utils/ready")
+def readiness():
+    """
+    200 once warm-up has finished, 503 before; the body reports each step.
+    """
+
+    warmup = app.state.warmup
+    return JSONResponse(warmup.report(), status_code=200 if warmup.ready else 503)
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
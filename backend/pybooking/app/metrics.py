@@ -0,0 +1,138 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+_BYTES_BUCKETS = (64e3, 256e3, 1e6, 4e6, 16e6, 64e6)
+
+STAGE_SECONDS = Histogram(
+    "booking_stage_seconds",
+    "Time spent per /stream pipeline stage",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+IMAGE_BYTES = Counter(
+    "booking_image_bytes_total",
+    "Uploaded image bytes before (raw) and after (compressed) preprocessing",
+    ["phase"],
+)
+UPLOAD_PEAK_BYTES = Histogram(
+    "booking_upload_peak_buffered_bytes",
+    "Peak raw upload bytes held in memory per request",
+    buckets=_BYTES_BUCKETS,
+)
+LLM_LINES = Counter(
+    "booking_llm_objects_total",
+    "JSON objects decoded from the LLM stream, and malformed lines dropped",
+    ["result"],
+)
+INVALID_EVENTS = Counter(
+    "booking_invalid_events_total",
+    "LLM events rejected by the route",
+    ["reason"],
+)
+FALLBACKS = Counter(
+    "booking_fallback_total",
+    "Comparisons or final verdicts computed server-side instead of by the model",
+    ["kind"],
+)
+IMAGE_TOKENS = Counter(
+    "booking_image_tokens_total",
+    "Estimated Gemini image tokens sent, and saved by sizing, cropping and deduplication",
+    ["kind"],
+)
+DUPLICATE_IMAGES = Counter(
+    "booking_duplicate_images_total",
+    "Near-duplicate screenshots answered from another screenshot's extraction",
+)
+SHORT_CIRCUITS = Counter(
+    "booking_llm_short_circuits_total",
+    "Batch generations stopped once every screenshot was extracted",
+)
+RETRIED_SCREENSHOTS = Counter(
+    "booking_retried_screenshots_total",
+    "Screenshots re-requested because they came back missing or all unclear",
+)
+TIER_REQUESTS = Counter(
+    "booking_llm_tier_requests_total",
+    "Per-screenshot extraction requests per model",
+    ["model"],
+)
+TIER_SECONDS = Histogram(
+    "booking_llm_tier_seconds",
+    "Per-screenshot extraction latency per model",
+    ["model"],
+    buckets=_LATENCY_BUCKETS,
+)
+TIER_TOKENS = Counter(
+    "booking_llm_tier_tokens_total",
+    "Tokens billed per model, from the response usage metadata",
+    ["model", "kind"],
+)
+ESCALATIONS = Counter(
+    "booking_llm_escalations_total",
+    "Screenshots re-extracted on the stronger model, by reason",
+    ["reason"],
+)
+CACHE_LOOKUPS = Counter(
+    "booking_extraction_cache_total",
+    "Extraction cache lookups",
+    ["result"],
+)
+INSTRUCTION_CACHE_LOOKUPS = Counter(
+    "booking_instruction_cache_total",
+    "Instruction prefix lookups: hit, miss (sent inline while cached content is created), unavailable (sent inline after a failed create) or below_minimum (too short to cache)",
+    ["result"],
+)
+INSTRUCTION_CACHE_TOKENS = Counter(
+    "booking_instruction_cache_tokens_total",
+    "Input tokens read from cached content instead of being sent, from the response usage metadata",
+)
+STORE_VALIDATIONS = Counter(
+    "booking_store_validations_total",
+    "Validation write attempts by outcome: written, failed (retried with the next flush unless dropped) or dropped",
+    ["result"],
+)
+BATCH_BOOKINGS = Counter(
+    "booking_batch_bookings_total",
+    "Bookings processed by /batch jobs",
+    ["result"],
+)
+INFLIGHT_STREAMS = Gauge(
+    "booking_inflight_streams",
+    "Open /stream responses",
+)
+QUEUE_DEPTH = Gauge(
+    "booking_queue_depth",
+    "Requests admitted but not yet calling the LLM",
+)
+ACTIVE_LLM_REQUESTS = Gauge(
+    "booking_active_llm_requests",
+    "Requests currently holding a scheduler slot",
+)
+
+
+class StageTimings:
+    """
+    Per-request stage timer. Every measurement feeds STAGE_SECONDS and is
+    also kept on the instance so it can be reported with the final event.
+    """
+
+    def __init__(self):
+        self.seconds: dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def as_ms(self) -> dict[str, float]:
+        return {stage: round(seconds * 1000, 1) for stage, seconds in self.seconds.items()}
@@ -65,3 +65,11 @@ class ComparisonItem(BaseModel):
 class StreamEvent(BaseModel):
     type: str  # progress | extraction | comparison | final
     payload: dict[str, object]
+
+class BatchBooking(BaseModel):
+    id: str
+    files: list[str]  # screenshot paths in the archive, or uploaded filenames
+    context: str | None = None
+
+class BatchManifest(BaseModel):
+    bookings: list[BatchBooking]
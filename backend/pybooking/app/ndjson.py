@@ -0,0 +1,212 @@
+import json
+import re
+
+# Characters that change the scanner state outside / inside a JSON string.
+_STRUCTURAL = re.compile(r'[{}"\n]')
+_IN_STRING = re.compile(r'["\\]')
+
+MAX_DIAGNOSTIC_SAMPLES = 5
+MAX_SAMPLE_CHARS = 200
+
+
+class NDJSONDecoder:
+    """
+    Incremental decoder for the model's newline-delimited JSON output.
+
+    Text is fed chunk by chunk without re-scanning earlier input. Complete
+    lines that hold one object go straight to json.loads; any other line is
+    handed to a character scanner that tracks brace depth and string state
+    across chunks and parses an object as soon as its closing brace arrives.
+    This recovers objects that span several lines or share a line, and text
+    outside any object (prose) is counted as malformed instead of being
+    silently dropped.
+    """
+
+    def __init__(self):
+        self._line: list[str] = []  # current line while between objects
+        self._parts: list[str] = []  # pending object text, joined once complete
+        self._garbage: list[str] = []  # non-JSON text on the current line
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.objects = 0
+        self.malformed = 0
+        self.samples: list[str] = []
+
+    def feed(self, text: str) -> list[dict]:
+        """
+        Consumes a chunk and returns the JSON objects it completed.
+        """
+
+        out: list[dict] = []
+        pos, n = 0, len(text)
+        while pos < n:
+            if self._depth or self._in_string or self._escape:
+                pos = self._scan(text, pos, out)
+                continue
+
+            # Line mode: well-formed NDJSON lines go straight to json.loads.
+            idx = text.find("\n", pos)
+            if idx == -1:
+                self._line.append(text[pos:])
+                break
+            self._line.append(text[pos:idx])
+            line = "".join(self._line)
+            self._line = []
+            pos = idx + 1
+            self._decode_line(line, out)
+        return out
+
+    def _decode_line(self, line: str, out: list[dict]) -> None:
+        stripped = line.strip()
+        if not stripped:
+            return
+        if stripped[0] == "{" and stripped[-1] == "}":
+            try:
+                obj = json.loads(stripped)
+            except ValueError:
+                pass
+            else:
+                self.objects += 1
+                out.append(obj)
+                return
+        # Not a single object: scan it to recover objects sharing the line or
+        # starting an object that continues on the next lines.
+        self._scan(line + "\n", 0, out)
+
+    def _scan(self, text: str, pos: int, out: list[dict]) -> int:
+        """
+        Character-level scanner. Returns the position just after the first
+        newline outside any object, or len(text).
+        """
+
+        n = len(text)
+        while pos < n:
+            if self._escape:
+                # escaped character split from its backslash across chunks
+                self._escape = False
+                self._parts.append(text[pos])
+                pos += 1
+                continue
+
+            if self._in_string:
+                m = _IN_STRING.search(text, pos)
+                if m is None:
+                    self._parts.append(text[pos:])
+                    return n
+                end = m.end()
+                if m.group() == "\\":
+                    if end == n:
+                        self._escape = True
+                    else:
+                        end += 1
+                else:
+                    self._in_string = False
+                self._parts.append(text[pos:end])
+                pos = end
+                continue
+
+            m = _STRUCTURAL.search(text, pos)
+            if m is None:
+                self._take(text[pos:])
+                return n
+            ch, idx = m.group(), m.start()
+
+            if self._depth == 0:
+                self._garbage.append(text[pos:idx])
+                if ch == "{":
+                    self._flush_garbage()
+                    self._depth = 1
+                    self._parts.append("{")
+                elif ch == "\n":
+                    self._flush_garbage()
+                    return idx + 1
+                else:
+                    # stray quote or closing brace outside an object
+                    self._garbage.append(ch)
+                pos = idx + 1
+                continue
+
+            self._parts.append(text[pos:idx + 1])
+            pos = idx + 1
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit("".join(self._parts), out)
+                    self._parts = []
+        return n
+
+    def close(self) -> list[dict]:
+        """
+        Flushes the end of the stream. An object that never closed is reported
+        as malformed, and any complete objects on the lines after its start are
+        still recovered.
+        """
+
+        out: list[dict] = []
+        if self._line:
+            line = "".join(self._line)
+            self._line = []
+            self._decode_line(line, out)
+        pending = "".join(self._parts)
+        self._parts = []
+        self._depth = 0
+        self._in_string = self._escape = False
+        if pending:
+            first_line, sep, rest = pending.partition("\n")
+            self._report(first_line)
+            if sep:
+                out.extend(self.feed(rest))
+                out.extend(self.close())
+        self._flush_garbage()
+        return out
+
+    @property
+    def diagnostics(self) -> dict:
+        return {"objects": self.objects, "malformed": self.malformed, "samples": list(self.samples)}
+
+    def _take(self, text: str) -> None:
+        if self._depth == 0:
+            self._garbage.append(text)
+        else:
+            self._parts.append(text)
+
+    def _emit(self, candidate: str, out: list[dict]) -> None:
+        try:
+            obj = json.loads(candidate)
+        except ValueError:
+            self._report(candidate)
+            return
+        self.objects += 1
+        out.append(obj)
+
+    def _flush_garbage(self) -> None:
+        line = "".join(self._garbage).strip()
+        self._garbage = []
+        # markdown fences and the SDK's terminator are expected noise
+        if line and line != "[DONE]" and not line.startswith("```"):
+            self._report(line)
+
+    def _report(self, text: str) -> None:
+        self.malformed += 1
+        if len(self.samples) < MAX_DIAGNOSTIC_SAMPLES:
+            self.samples.append(text[:MAX_SAMPLE_CHARS])
+
+
+class JSONArrayDecoder(NDJSONDecoder):
+    """
+    Incremental decoder for a streamed top-level JSON array of objects, the
+    shape Gemini produces under a list response schema. Each element is
+    returned as soon as its closing brace arrives; the brackets and commas
+    between elements are expected, not malformed.
+    """
+
+    def _flush_garbage(self) -> None:
+        if "".join(self._garbage).strip(" \t\r\n[],"):
+            super()._flush_garbage()
+        else:
+            self._garbage = []
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import NamedTuple
+from PIL import Image
+
+from app.dedupe import perceptual_hash
+from app.sizing import analyse_layout, choose_width, estimate_tokens
+
+MAX_SAFE_BYTES = 2_400_000  # 2.4 MB safe threshold
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Rough upper bounds of JPEG output size per pixel for screenshot-like content
+# (sharp text on flat backgrounds), used to pick size and quality up front.
+_BYTES_PER_PIXEL = {60: 0.35, 45: 0.25}
+
+_pool: ProcessPoolExecutor | None = None
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedImage(NamedTuple):
+    jpeg: bytes
+    phash: int | None
+    tokens: int  # estimated Gemini image tokens
+    baseline_tokens: int  # estimate for a plain resize to max_width
+
+
+def _target_size(w: int, h: int, max_width: int, max_bytes: int) -> tuple[int, int, int]:
+    """
+    Picks output width, height and JPEG quality in one pass so the encoded
+    image is expected to fit under max_bytes.
+    """
+
+    scale = min(1.0, max_width / w)
+    for quality in (60, 45):
+        budget_pixels = max_bytes / _BYTES_PER_PIXEL[quality]
+        if (w * scale) * (h * scale) <= budget_pixels:
+            break
+    else:
+        # Even the lower quality would not fit: shrink until the estimate does.
+        scale = min(scale, (budget_pixels / (w * h)) ** 0.5)
+    return max(1, int(w * scale)), max(1, int(h * scale)), quality
+
+
+def compress_image(orig_bytes: bytes, max_width: int = 800, max_bytes: int = MAX_SAFE_BYTES) -> bytes:
+    """
+    Resize + compress image to keep payload small. Returns JPEG bytes.
+
+    Flat margins are cropped away and the width is chosen from the size of
+    the smallest text (see app/sizing.py), so the image costs as few tokens
+    as possible while staying legible.
+    """
+
+    try:
+        img = Image.open(BytesIO(orig_bytes))
+        w, h = img.size
+        # JPEG: let the decoder downscale by a power of two (DCT scaling) instead
+        # of decoding at full resolution.
+        img.draft("RGB", (min(w, max_width), min(w, max_width) * h // w))
+        img = img.convert("RGB")
+        box, line_height = analyse_layout(img)
+        if box != (0, 0, *img.size):
+            img = img.crop(box)
+        w, h = img.size
+        new_w, new_h, quality = _target_size(w, h, choose_width(w, h, line_height, max_width), max_bytes)
+    except Exception:
+        # If PIL can't open, return original bytes
+        return orig_bytes
+
+    if img.size != (new_w, new_h):
+        # reducing_gap does a cheap integer reduce() before the LANCZOS pass.
+        img = img.resize((new_w, new_h), Image.LANCZOS, reducing_gap=3.0)
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=quality)
+    data = out.getvalue()
+
+    if len(data) > max_bytes:
+        # Estimate was off (unusually noisy image): one corrective pass scaled
+        # by the observed overshoot.
+        ratio = (max_bytes / len(data)) ** 0.5 * 0.9
+        img = img.resize((max(1, int(new_w * ratio)), max(1, int(new_h * ratio))), Image.LANCZOS)
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=45)
+        data = out.getvalue()
+    return data
+
+
+def prepare_image(orig_bytes: bytes, max_width: int = 800, max_bytes: int = MAX_SAFE_BYTES) -> PreparedImage:
+    """
+    Pool worker: compresses the image and hashes the result for duplicate
+    detection while it is still in the worker.
+    """
+
+    data = compress_image(orig_bytes, max_width, max_bytes)
+    try:
+        w, h = Image.open(BytesIO(orig_bytes)).size
+        baseline = estimate_tokens(min(w, max_width), int(h * min(1.0, max_width / w)))
+        tokens = estimate_tokens(*Image.open(BytesIO(data)).size)
+    except Exception:
+        baseline = tokens = 0
+    return PreparedImage(data, perceptual_hash(data), tokens, baseline)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PREPROCESS_WORKERS)
+    return _pool
+
+
+def _replace_pool(broken: ProcessPoolExecutor) -> None:
+    """
+    Drops a pool whose worker died (e.g. OOM-killed on a huge image); a
+    broken pool refuses all further work, so the next submit starts afresh.
+    """
+
+    global _pool
+    if _pool is broken:
+        _pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _warm_worker() -> int:
+    # a real round trip through the JPEG/PNG codecs and the sizing helpers
+    buf = BytesIO()
+    Image.new("RGB", (64, 64), "white").save(buf, format="PNG")
+    prepare_image(buf.getvalue())
+    return os.getpid()
+
+
+async def warm_pool() -> int:
+    """
+    Starts every worker of the shared process pool and primes PIL in each,
+    so the first upload doesn't pay for process spawns and codec imports.
+    Returns the number of distinct workers that answered.
+    """
+
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    pids = await asyncio.gather(*(loop.run_in_executor(pool, _warm_worker) for _ in range(PREPROCESS_WORKERS)))
+    return len(set(pids))
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def submit_compress(raw: bytes, max_bytes: int = MAX_SAFE_BYTES) -> asyncio.Future:
+    """
+    Starts compressing one image in the shared process pool and returns a
+    future for its PreparedImage. If the pool turns out to be broken, it is
+    replaced and the image tried once more.
+    """
+
+    return asyncio.ensure_future(_compress(raw, max_bytes))
+
+
+async def _compress(raw: bytes, max_bytes: int) -> PreparedImage:
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    try:
+        return await loop.run_in_executor(pool, prepare_image, raw, 800, max_bytes)
+    except BrokenProcessPool:
+        logger.warning("preprocessing pool broken, restarting it")
+        _replace_pool(pool)
+    return await loop.run_in_executor(_get_pool(), prepare_image, raw, 800, max_bytes)
+
+
+async def preprocess_images(image_bytes_list: list[bytes], max_bytes: int = MAX_SAFE_BYTES) -> list[bytes]:
+    """
+    Compresses all images concurrently in the shared process pool, keeping
+    the event loop free. Results are returned in input order.
+    """
+
+    prepared = await asyncio.gather(*(submit_compress(raw, max_bytes) for raw in image_bytes_list))
+    return [image.jpeg for image in prepared]
@@ -0,0 +1,66 @@
+import asyncio
+from typing import Literal
+
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import StreamingResponse
+
+from app.batch import parse_manifest, read_archive, run_batch, upload_reader
+from app.uploads import UploadRejected
+from app.warmup import llm_client
+
+
+router = APIRouter(
+    prefix="/batch"
+)
+
+
+@router.post("")
+async def batch_endpoint(
+    request: Request,
+    archive: UploadFile | None = File(None),
+    manifest: str | None = Form(None),
+    files: list[UploadFile] | None = File(None),
+    mode: Literal["structured", "per_screenshot"] = Form("structured"),
+    price_tolerance: float = Form(0.0, ge=0),
+    normalize_dates: bool = Form(False),
+    hotel_similarity: float | None = Form(None, ge=0, le=1),
+):
+    """
+    Validates many bookings in one request and streams one NDJSON line per
+    booking as it completes, then a "done" line.
+
+    Send either `archive`, a zip with one directory of screenshots per
+    booking (or a manifest.json listing them), or a `manifest` JSON,
+    {"bookings": [{"id", "files", "context"}]}, together with the `files` it
+    names.
+
+    Comparisons match /stream's exactly unless loosened: `price_tolerance`
+    (total prices at most this far apart match), `normalize_dates` (dates in
+    common written formats compare as ISO dates) and `hotel_similarity` (0..1,
+    case- and punctuation-insensitive fuzzy hotel names).
+    """
+
+    try:
+        if archive is not None:
+            bookings, read = await asyncio.to_thread(read_archive, archive.file)
+        elif manifest is not None:
+            bookings, read = parse_manifest(manifest), upload_reader(files or [])
+        else:
+            raise UploadRejected(422, "expected an archive, or a manifest with files")
+    except UploadRejected as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+
+    return StreamingResponse(
+        run_batch(
+            bookings,
+            read,
+            client=await llm_client(request.app),
+            scheduler=request.app.state.scheduler,
+            store=request.app.state.store,
+            mode=mode,
+            price_tolerance=price_tolerance,
+            normalize_dates=normalize_dates,
+            hotel_similarity=hotel_similarity,
+        ),
+        media_type="application/x-ndjson",
+    )
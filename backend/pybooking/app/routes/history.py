@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+
+
+router = APIRouter(
+    prefix="/history"
+)
+
+
+def _store(request: Request):
+    store = request.app.state.store
+    if store is None:
+        raise HTTPException(status_code=503, detail="Validation history is disabled (DATABASE_URL is not set)")
+    return store
+
+
+@router.get("")
+async def list_validations(
+    request: Request,
+    image_key: str | None = Query(None, description="sha256 of an uploaded screenshot"),
+    hotel_name: str | None = Query(None),
+    check_in: str | None = Query(None, description="YYYY-MM-DD"),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """
+    Most recent stored validations, optionally only those containing a given
+    screenshot or booking.
+    """
+
+    return await _store(request).history(image_key, hotel_name, check_in, limit)
+
+
+@router.get("/{validation_id}")
+async def get_validation(request: Request, validation_id: str):
+    """
+    One stored validation with its extractions, comparisons and verdict.
+    """
+
+    validation = await _store(request).validation(validation_id)
+    if validation is None:
+        raise HTTPException(status_code=404, detail="Validation not found")
+    return validation
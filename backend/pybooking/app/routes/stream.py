@@ -1,131 +1,527 @@
-import json
-import uuid
+import asyncio
+import math
+import os
 import traceback
-from typing import AsyncGenerator
+from contextlib import aclosing
+from typing import AsyncGenerator, AsyncIterator, Literal, TypeVar
 
-from fastapi import APIRouter, UploadFile, File, Form
+from fastapi import APIRouter, Header, HTTPException, UploadFile, File, Form, Query, Request
 from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.background import BackgroundTask
 
-from app.llm_client import llm_stream
-from app.compare_fields import compare_fields
-from app.models.models import MatchStatus, StreamEvent, ScreenshotResult
+from app.cache import all_unclear, extraction_cache
+from app.llm_client import FAST_MODEL, llm_extract_each, llm_extract_tiered, llm_stream, llm_stream_structured
+from app.compare_fields import IncrementalComparator, compare_fields, summarize
+from app.dedupe import confirm_duplicates, group_near_duplicates
+from app.events import JOINED_INFLIGHT_RUN, NO_IMAGES_RECEIVED, serialize_event, validate_event
+from app.metrics import (
+    CACHE_LOOKUPS,
+    DUPLICATE_IMAGES,
+    IMAGE_TOKENS,
+    FALLBACKS,
+    INFLIGHT_STREAMS,
+    INVALID_EVENTS,
+    RETRIED_SCREENSHOTS,
+    SHORT_CIRCUITS,
+    UPLOAD_PEAK_BYTES,
+    StageTimings,
+)
+from app.models.models import ComparisonItem, ScreenshotResult
+from app.scheduler import AdmissionError
+from app.singleflight import parse_event_id, request_fingerprint
+from app.uploads import IncomingImage, UploadRejected, discard, ingest_uploads
+from app.warmup import llm_client
 
 
 router = APIRouter(
     prefix="/stream"
 )
 
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+# Stop batch-mode generation once every screenshot is extracted and compare
+# server-side instead of waiting for the model's comparison and final text.
+SHORT_CIRCUIT_LLM = os.getenv("SHORT_CIRCUIT_LLM", "").lower() in ("1", "true", "yes")
+# Extra attempts for screenshots without a usable extraction, 0 disables.
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "2"))
+RETRY_BASE_SECONDS = float(os.getenv("RETRY_BASE_SECONDS", "1"))
+RETRY_MAX_SECONDS = float(os.getenv("RETRY_MAX_SECONDS", "8"))
+
+T = TypeVar("T")
+
+
+async def _no_events() -> AsyncGenerator[dict, None]:
+    return
+    yield
+
+
+async def _until_disconnected(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
 
-def serialize_event(event_type: str, payload: dict) -> bytes:
+async def _until_client_leaves(request: Request, events: AsyncIterator[T]) -> AsyncGenerator[T, None]:
     """
-    Serializes an SSE event.
+    Yields from events until they end or the client disconnects. On
+    disconnect the source generator is closed and iteration stops; for a
+    single-flight subscription that cancels the run once nobody else follows it.
     """
 
-    return f"data: {json.dumps({'type': event_type, 'payload': payload}, default=str)}\n\n".encode(
-        "utf-8"
-    )
+    watcher = asyncio.create_task(_until_disconnected(request))
+    try:
+        async with aclosing(events):
+            while True:
+                next_event = asyncio.ensure_future(anext(events))
+                await asyncio.wait({next_event, watcher}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_event.done():
+                    next_event.cancel()
+                    await asyncio.gather(next_event, return_exceptions=True)
+                    return
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    return
+                yield event
+    finally:
+        watcher.cancel()
 
 
 @router.post("")
 async def stream_endpoint(
+    request: Request,
     files: list[UploadFile] = File(...),
     context: str | None = Form(None),
+    mode: Literal["batch", "per_screenshot", "structured"] = Form("batch"),
+    timings: bool = Query(False),
 ):
     """
     Streams extraction, comparison, and final validation results
     for uploaded booking screenshots.
+
+    mode=batch sends every screenshot in one prompt and lets the model compare;
+    mode=per_screenshot extracts each screenshot with its own concurrent request
+    (on the fast model tier first, see llm_extract_tiered) and always compares
+    server-side; mode=structured sends every screenshot in
+    one prompt with a response schema, so the model only extracts and the
+    comparison is done server-side.
+
+    Requests wait in the scheduler's queue (reported through 'queued' progress
+    events) before calling the LLM; when the queue is full the request is
+    rejected with 429.
+
+    With ?timings=true the final event also carries per-stage timings in ms.
+
+    Frames of the validation itself carry an SSE id "<run_id>:<seq>"; a client
+    that loses the connection can pick up where it left off with
+    GET /stream/{run_id}.
     """
 
+    scheduler = request.app.state.scheduler
+    inflight = request.app.state.inflight
+    try:
+        ticket = scheduler.admit()
+    except AdmissionError as exc:
+        raise HTTPException(
+            status_code=429,
+            detail=str(exc),
+            headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        )
+
+    # Read, hash and size-check uploads before answering, so oversized or
+    # non-image files are refused with a proper status code.
+    stage_timings = StageTimings()
+    try:
+        with stage_timings.stage("upload_read"):
+            ingest = await ingest_uploads(files)
+    except UploadRejected as exc:
+        scheduler.release(ticket)
+        raise HTTPException(status_code=exc.status_code, detail=str(exc))
+    except BaseException:
+        # any other failure (or a disconnect) ends the request too; a ticket
+        # left behind would hold a queue place forever
+        scheduler.release(ticket)
+        raise
+    UPLOAD_PEAK_BYTES.observe(ingest.peak_buffered_bytes)
+
+    # Tickets handed to a single-flight run are released by that run.
+    handed_off: list = []
+
+    def _release_unless_handed_off() -> None:
+        if not handed_off:
+            scheduler.release(ticket)
+
     async def event_generator() -> AsyncGenerator[bytes, None]:
-        image_bytes: list[bytes] = []
-        filenames: list[str] = []
+        INFLIGHT_STREAMS.inc()
+        try:
+            async for frame in validation_frames():
+                yield frame
+        finally:
+            INFLIGHT_STREAMS.dec()
 
-        # --- Read uploaded files ---
-        for file in files:
-            try:
-                content = await file.read()
-                image_bytes.append(content)
-                filenames.append(file.filename or str(uuid.uuid4()))
-            except Exception as exc:
-                yield serialize_event(
-                    "progress",
-                    {
-                        "message": f"file_read_error: {file.filename}",
-                        "error": str(exc),
-                        "trace": traceback.format_exc(),
-                    },
-                )
+    async def validation_frames() -> AsyncGenerator[bytes, None]:
+        for error in ingest.errors:
+            yield serialize_event("progress", error)
 
-        if not image_bytes:
-            yield serialize_event(
-                "progress",
-                {"message": "no_images_received"},
-            )
+        if not ingest.images:
+            scheduler.release(ticket)
+            yield NO_IMAGES_RECEIVED
             return
 
+        yield serialize_event(
+            "progress",
+            {
+                "message": "upload_received",
+                "files": len(ingest.images),
+                "bytes_received": ingest.bytes_received,
+                "peak_buffered_bytes": ingest.peak_buffered_bytes,
+            },
+        )
+
+        # --- Attach to an identical in-flight run, or start one ---
+        images = ingest.images
+        fingerprint = request_fingerprint(
+            [image.key for image in images],
+            [image.filename for image in images],
+            context,
+            # timed runs carry different final events, so don't share them
+            f"{mode}+timings" if timings else mode,
+        )
+        frames, started = inflight.subscribe(fingerprint, lambda: validation_run(images))
+        if started:
+            handed_off.append(ticket)
+        else:
+            # the running request already holds a scheduler slot and compressed images
+            scheduler.release(ticket)
+            discard(images)
+            yield JOINED_INFLIGHT_RUN
+
+        async for frame in _until_client_leaves(request, frames):
+            yield frame
+
+    async def validation_run(images: list[IncomingImage]) -> AsyncGenerator[bytes, None]:
+        """
+        Produces the frames of one validation. Runs in its own task and is
+        shared by every subscriber with the same fingerprint.
+        """
+
         screenshots: list[ScreenshotResult] = []
+        # what the client was told, kept for the validation store
+        reported_comparisons: list[ComparisonItem] = []
+        summary: dict | None = None
         model_emitted_comparisons = False
         model_emitted_final = False
 
+        # Provisional comparisons go out as soon as a field has both an
+        # initial and a final value; the complete set follows at the end.
+        comparator = IncrementalComparator()
+
+        # A retried screenshot's result replaces its earlier one.
+        index_by_id: dict[str, int] = {}
+
+        def record(screenshot: ScreenshotResult) -> None:
+            idx = index_by_id.get(screenshot.screenshot_id)
+            if idx is None:
+                index_by_id[screenshot.screenshot_id] = len(screenshots)
+                screenshots.append(screenshot)
+            else:
+                screenshots[idx] = screenshot
+
+        def needs_retry(sid: str) -> bool:
+            idx = index_by_id.get(sid)
+            return idx is None or all_unclear(screenshots[idx])
+
+        def provisional(screenshot: ScreenshotResult) -> list[bytes]:
+            return [
+                serialize_event("comparison", {**item.model_dump(), "provisional": True})
+                for item in comparator.add(screenshot)
+            ]
+
+        def serve_cached(image: IncomingImage, cached: ScreenshotResult) -> list[bytes]:
+            image.compressed.cancel()
+            screenshot = cached.model_copy(update={"screenshot_id": image.filename})
+            record(screenshot)
+            return [
+                serialize_event(
+                    "extraction",
+                    {"screenshot": screenshot.model_dump(mode="json"), "cached": True},
+                ),
+                *provisional(screenshot),
+            ]
+
+        # --- Serve cached extractions, send only the rest to the LLM ---
+        store = request.app.state.store
+        image_keys = {image.filename: image.key for image in images}
+        uncached: list[IncomingImage] = []
+        key_by_id: dict[str, str] = {}
+        for image in images:
+            cached = await extraction_cache.get(image.key)
+            if cached is None:
+                uncached.append(image)
+                continue
+            CACHE_LOOKUPS.labels("hit").inc()
+            for frame in serve_cached(image, cached):
+                yield frame
+
+        # Misses fall through to the shared store, which other workers fill too.
+        if store is not None and uncached:
+            try:
+                stored = await store.find_extractions([image.key for image in uncached])
+            except Exception as exc:
+                stored = {}
+                yield serialize_event("progress", {"message": "store_error", "error": str(exc)})
+            missed = []
+            for image in uncached:
+                cached = stored.get(image.key)
+                if cached is None:
+                    missed.append(image)
+                    continue
+                CACHE_LOOKUPS.labels("store_hit").inc()
+                await extraction_cache.put(image.key, cached)
+                for frame in serve_cached(image, cached):
+                    yield frame
+            uncached = missed
+
+        for image in uncached:
+            CACHE_LOOKUPS.labels("miss").inc()
+            key_by_id[image.filename] = image.key
+
+        # The model only sees the uncached screenshots, so its comparison and
+        # final events would be incomplete; compute them server-side instead.
+        server_side_comparison = len(uncached) < len(images)
+        duplicates: dict[str, list[IncomingImage]] = {}
+        expected_extractions = 0
+        extracted_ids: set[str] = set()
+        # screenshots the tiered path re-extracted on the strong model: that was their retry
+        escalated: set[str] = set()
+
         # --- Stream from LLM ---
+        client = None
+        to_send: list[int] = []
+        model_final: dict | None = None
         try:
-            async for raw_event in llm_stream(image_bytes, filenames, context):
-                if not isinstance(raw_event, dict):
-                    yield serialize_event(
-                        "progress",
-                        {"message": "invalid_event_format", "raw": raw_event},
-                    )
-                    continue
+            events = _no_events()
+            if uncached:
+                cost = len(uncached) if mode == "per_screenshot" else 1
+                with stage_timings.stage("queue_wait"):
+                    async for position in scheduler.wait(ticket, cost):
+                        yield serialize_event("progress", position)
 
-                # Normalize Gemini-style payloads
-                if "type" not in raw_event and "event_type" in raw_event:
-                    raw_event["type"] = raw_event.pop("event_type")
+                with stage_timings.stage("compress_wait"):
+                    prepared = await asyncio.gather(*(image.compressed for image in uncached))
 
-                event_type = raw_event.get("type")
-                if not event_type:
-                    yield serialize_event(
-                        "progress",
-                        {"message": "missing_event_type", "raw": raw_event},
+                # Near-identical screenshots go to the model once; the others
+                # reuse their representative's extraction. Hash matches are
+                # confirmed on the pixels the model would see.
+                representative = group_near_duplicates([p.phash for p in prepared])
+                if any(rep != i for i, rep in enumerate(representative)):
+                    representative = await asyncio.to_thread(
+                        confirm_duplicates, representative, [p.jpeg for p in prepared]
                     )
-                    continue
-
-                # Forward progress/debug events verbatim
-                if event_type == "progress":
+                to_send = [i for i, rep in enumerate(representative) if rep == i]
+                for i, rep in enumerate(representative):
+                    if rep != i:
+                        duplicates.setdefault(uncached[rep].filename, []).append(uncached[i])
+                if duplicates:
+                    DUPLICATE_IMAGES.inc(len(uncached) - len(to_send))
+                    # a copied extraction is never stored under the copy's own
+                    # hash, where exact-byte lookups would trust it
+                    for dups in duplicates.values():
+                        for image in dups:
+                            image_keys.pop(image.filename, None)
+                    # the model never sees the duplicates' ids
+                    server_side_comparison = True
                     yield serialize_event(
                         "progress",
-                        raw_event.get("payload", {"message": "progress"}),
+                        {
+                            "message": "duplicates_skipped",
+                            "duplicates": {
+                                sid: [image.filename for image in dups] for sid, dups in duplicates.items()
+                            },
+                        },
                     )
-                    continue
 
-                # Validate structured events
+                # saved relative to sending every screenshot resized to 800 px wide
+                tokens = sum(prepared[i].tokens for i in to_send)
+                tokens_saved = sum(p.baseline_tokens for p in prepared) - tokens
+                IMAGE_TOKENS.labels("sent").inc(tokens)
+                IMAGE_TOKENS.labels("saved").inc(tokens_saved)
+                yield serialize_event(
+                    "progress",
+                    {"message": "image_tokens", "estimated_tokens": tokens, "tokens_saved": tokens_saved},
+                )
+
+                expected_extractions = len(to_send)
+                client = await llm_client(request.app)
+                llm = {
+                    "batch": llm_stream,
+                    "per_screenshot": llm_extract_tiered if FAST_MODEL else llm_extract_each,
+                    "structured": llm_stream_structured,
+                }[mode]
+                # escalations to the stronger model are extra requests against the rate limits
+                extra = {"charge": scheduler.charge} if llm is llm_extract_tiered else {}
+                events = llm(
+                    [prepared[i].jpeg for i in to_send],
+                    [uncached[i].filename for i in to_send],
+                    context,
+                    client=client,
+                    preprocessed=True,
+                    timings=stage_timings,
+                    **extra,
+                )
+
+            # Screenshots that come back missing or entirely unclear are asked
+            # for again, one request each, with capped exponential backoff.
+            attempt = 0
+            while True:
+                async with aclosing(events):
+                    async for raw_event in events:
+                        if not isinstance(raw_event, dict):
+                            INVALID_EVENTS.labels("invalid_event_format").inc()
+                            yield serialize_event(
+                                "progress",
+                                {"message": "invalid_event_format", "raw": raw_event},
+                            )
+                            continue
+
+                        # Normalize Gemini-style payloads
+                        if "type" not in raw_event and "event_type" in raw_event:
+                            raw_event["type"] = raw_event.pop("event_type")
+
+                        event_type = raw_event.get("type")
+                        if not event_type:
+                            INVALID_EVENTS.labels("missing_event_type").inc()
+                            yield serialize_event(
+                                "progress",
+                                {"message": "missing_event_type", "raw": raw_event},
+                            )
+                            continue
+
+                        # Forward progress/debug events verbatim
+                        if event_type == "progress":
+                            payload = raw_event.get("payload", {"message": "progress"})
+                            if payload.get("message") == "escalating_screenshots":
+                                escalated.update(payload.get("screenshots", ()))
+                            yield serialize_event("progress", payload)
+                            continue
+
+                        # Validate structured events (extractions once, as a screenshot)
+                        try:
+                            with stage_timings.stage("validation"):
+                                screenshot = validate_event(raw_event)
+                        except Exception as exc:
+                            INVALID_EVENTS.labels("invalid_event_skipped").inc()
+                            yield serialize_event(
+                                "progress",
+                                {
+                                    "message": "invalid_event_skipped",
+                                    "error": str(exc),
+                                    "raw": raw_event,
+                                    "trace": traceback.format_exc(),
+                                },
+                            )
+                            continue
+
+                        if server_side_comparison and event_type in ("comparison", "final"):
+                            continue
+
+                        if event_type == "final":
+                            # held back until it's clear no screenshot needs a retry
+                            model_final = raw_event["payload"]
+                            continue
+                        yield serialize_event(event_type, raw_event["payload"])
+
+                        if event_type == "comparison":
+                            model_emitted_comparisons = True
+                            try:
+                                reported_comparisons.append(ComparisonItem.model_validate(raw_event["payload"]))
+                            except ValidationError:
+                                pass
+                        elif event_type == "extraction":
+                            if screenshot is None:
+                                continue
+                            record(screenshot)
+                            extracted_ids.add(screenshot.screenshot_id)
+                            for frame in provisional(screenshot):
+                                yield frame
+                            key = key_by_id.get(screenshot.screenshot_id)
+                            if key and not all_unclear(screenshot):
+                                await extraction_cache.put(key, screenshot)
+                            for duplicate in duplicates.get(screenshot.screenshot_id, []):
+                                copy = screenshot.model_copy(update={"screenshot_id": duplicate.filename})
+                                record(copy)
+                                yield serialize_event(
+                                    "extraction",
+                                    {
+                                        "screenshot": copy.model_dump(mode="json"),
+                                        "duplicate_of": screenshot.screenshot_id,
+                                    },
+                                )
+                                for frame in provisional(copy):
+                                    yield frame
+
+                            if (
+                                SHORT_CIRCUIT_LLM
+                                and mode == "batch"
+                                and not model_emitted_comparisons
+                                and len(extracted_ids) >= expected_extractions
+                            ):
+                                # all that's left is comparison and final text we
+                                # compute ourselves; closing `events` stops generation
+                                SHORT_CIRCUITS.inc()
+                                yield serialize_event("progress", {"message": "llm_short_circuited"})
+                                break
+
+                retry = [
+                    i for i in to_send
+                    if uncached[i].filename not in escalated and needs_retry(uncached[i].filename)
+                ]
+                if not retry or client is None or attempt >= RETRY_ATTEMPTS:
+                    break
+                # every retried screenshot is one more LLM request against the rate limits
                 try:
-                    StreamEvent.model_validate(raw_event)
-                except Exception as exc:
+                    await scheduler.charge(len(retry))
+                except AdmissionError as exc:
                     yield serialize_event(
                         "progress",
                         {
-                            "message": "invalid_event_skipped",
-                            "error": str(exc),
-                            "raw": raw_event,
-                            "trace": traceback.format_exc(),
+                            "message": "retry_skipped",
+                            "reason": str(exc),
+                            "retry_after_seconds": math.ceil(exc.retry_after),
+                            "screenshots": [uncached[i].filename for i in retry],
                         },
                     )
-                    continue
+                    break
+                delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt)
+                attempt += 1
+                RETRIED_SCREENSHOTS.inc(len(retry))
+                yield serialize_event(
+                    "progress",
+                    {
+                        "message": "retrying_screenshots",
+                        "attempt": attempt,
+                        "screenshots": [uncached[i].filename for i in retry],
+                        "delay_seconds": delay,
+                    },
+                )
+                await asyncio.sleep(delay)
+                events = llm_extract_each(
+                    [prepared[i].jpeg for i in retry],
+                    [uncached[i].filename for i in retry],
+                    context,
+                    client=client,
+                    preprocessed=True,
+                    timings=stage_timings,
+                )
 
-                yield serialize_event(event_type, raw_event["payload"])
-
-                if event_type == "comparison":
-                    model_emitted_comparisons = True
-                elif event_type == "final":
-                    model_emitted_final = True
-                elif event_type == "extraction":
-                    try:
-                        screenshot = ScreenshotResult.model_validate(
-                            raw_event["payload"]["screenshot"]
-                        )
-                        screenshots.append(screenshot)
-                    except Exception:
-                        pass
+            if attempt:
+                # the model's comparisons and verdict predate the retried extractions
+                model_emitted_comparisons = False
+            elif model_final is not None:
+                if timings:
+                    model_final["timings"] = stage_timings.as_ms()
+                yield serialize_event("final", model_final)
+                model_emitted_final = True
+                summary = model_final.get("summary")
 
         except Exception as exc:
             yield serialize_event(
@@ -136,12 +532,17 @@ async def stream_endpoint(
                     "trace": traceback.format_exc(),
                 },
             )
+        finally:
+            scheduler.release(ticket)
 
         # --- Server-side comparison fallback ---
         comparisons = None
         if not model_emitted_comparisons and screenshots:
+            FALLBACKS.labels("comparison").inc()
             try:
-                comparisons = compare_fields(screenshots)
+                with stage_timings.stage("compare_fields"):
+                    comparisons = compare_fields(screenshots)
+                reported_comparisons = comparisons
                 for comp in comparisons:
                     yield serialize_event(
                         "comparison",
@@ -159,34 +560,16 @@ async def stream_endpoint(
 
         # --- Final summary ---
         if not model_emitted_final:
+            FALLBACKS.labels("final").inc()
             try:
                 if comparisons is None and screenshots:
-                    comparisons = compare_fields(screenshots)
-                if comparisons:
-                    matches = sum(c.status == MatchStatus.MATCH for c in comparisons)
-                    mismatches = sum(c.status == MatchStatus.MISMATCH for c in comparisons)
-                    unclears = sum(c.status == MatchStatus.UNCLEAR for c in comparisons)
-
-                    overall = (
-                        "match"
-                        if mismatches == 0 and unclears == 0 and matches > 0
-                        else "mismatch"
-                        if mismatches > 0
-                        else "unclear"
-                    )
-
-                    detail = (
-                        f"{matches} match, "
-                        f"{mismatches} mismatch, "
-                        f"{unclears} unclear"
-                    )
-                else:
-                    overall = "unclear"
-                    detail = "no comparison data"
-                yield serialize_event(
-                    "final",
-                    {"summary": {"overall": overall, "detail": detail}},
-                )
+                    with stage_timings.stage("compare_fields"):
+                        comparisons = compare_fields(screenshots)
+                final = {"summary": summarize([c.status for c in comparisons or []])}
+                if timings:
+                    final["timings"] = stage_timings.as_ms()
+                yield serialize_event("final", final)
+                summary = final["summary"]
 
             except Exception as exc:
                 yield serialize_event(
@@ -198,6 +581,59 @@ async def stream_endpoint(
                     },
                 )
 
+        # --- Persist (batched with other runs; announced once committed) ---
+        if store is not None and screenshots:
+            try:
+                validation_id = await store.save(
+                    mode, context, screenshots, image_keys, reported_comparisons, summary
+                )
+            except Exception as exc:
+                yield serialize_event("progress", {"message": "store_error", "error": str(exc)})
+            else:
+                yield serialize_event(
+                    "progress", {"message": "validation_stored", "validation_id": validation_id}
+                )
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+        # safety net in case the generator never runs
+        background=BackgroundTask(_release_unless_handed_off),
+    )
+
+
+@router.get("/{run_id}")
+async def resume_endpoint(
+    request: Request,
+    run_id: str,
+    last_event_id: str | None = Header(None),
+    after: int | None = Query(None, description="seq of the last frame received; Last-Event-ID takes precedence"),
+):
+    """
+    Resumes the event stream of a live or recently finished validation,
+    starting after the frame named by the Last-Event-ID header (or ?after=).
+    Frames come from the run's buffer, and a live run is followed until it
+    ends; the model is never called again. Unknown or expired runs answer 404.
+    """
+
+    seq = after if after is not None else -1
+    parsed = parse_event_id(last_event_id)
+    if parsed is not None and parsed[0] == run_id:
+        seq = parsed[1]
+
+    frames = request.app.state.inflight.resume(run_id, seq)
+    if frames is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired run")
+
+    async def event_generator() -> AsyncGenerator[bytes, None]:
+        INFLIGHT_STREAMS.inc()
+        try:
+            async for frame in _until_client_leaves(request, frames):
+                yield frame
+        finally:
+            INFLIGHT_STREAMS.dec()
+
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream",
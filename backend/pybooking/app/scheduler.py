@@ -0,0 +1,223 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import AsyncGenerator
+
+MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "4"))
+MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", "32"))
+# 0 disables the limit. The Gemini free tier allows roughly 10/minute and 20/day.
+REQUESTS_PER_MINUTE = float(os.getenv("SCHEDULER_REQUESTS_PER_MINUTE", "0"))
+REQUESTS_PER_DAY = float(os.getenv("SCHEDULER_REQUESTS_PER_DAY", "0"))
+# Requests whose estimated wait exceeds this are rejected instead of queued.
+MAX_WAIT_SECONDS = float(os.getenv("SCHEDULER_MAX_WAIT_SECONDS", "120"))
+PROGRESS_INTERVAL_SECONDS = 2.0
+INITIAL_SERVICE_SECONDS = 10.0
+
+
+class AdmissionError(Exception):
+    """
+    Raised when a request cannot be queued; the route maps it to HTTP 429.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `capacity` tokens, refilled continuously
+    at `capacity / period` tokens per second.
+    """
+
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, n: float = 1) -> float:
+        """
+        Seconds until n tokens are available (0 if they are now).
+        """
+
+        self._refill()
+        n = min(n, self.capacity)
+        return max(0.0, (n - self.tokens) / self.rate)
+
+    def take(self, n: float = 1) -> None:
+        self._refill()
+        self.tokens -= min(n, self.capacity)
+
+
+class Ticket:
+    def __init__(self):
+        self.cost = 1
+        self.granted = asyncio.Event()
+        self.changed = asyncio.Event()
+        self.queued = False
+        self.released = False
+        self.started_at: float | None = None
+
+
+class Scheduler:
+    """
+    Admission control in front of the LLM: at most `max_concurrency` requests
+    run at once, starts are paced by per-minute and per-day token buckets, and
+    up to `max_queue` requests wait in FIFO order. Beyond that, admit() fails
+    fast so the route can answer 429.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        max_queue: int = MAX_QUEUE,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        requests_per_day: float = REQUESTS_PER_DAY,
+        max_wait_seconds: float = MAX_WAIT_SECONDS,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.buckets: list[TokenBucket] = []
+        if requests_per_minute > 0:
+            self.buckets.append(TokenBucket(requests_per_minute, 60))
+        if requests_per_day > 0:
+            self.buckets.append(TokenBucket(requests_per_day, 86400))
+        self.active = 0
+        self._pending = 0  # admitted, not yet running or released
+        self.service_seconds = INITIAL_SERVICE_SECONDS
+        self._waiting: deque[Ticket] = deque()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending
+
+    def admit(self) -> Ticket:
+        """
+        Reserves a place for a new request, or raises AdmissionError when the
+        wait queue is full or the estimated wait is too long.
+        """
+
+        # Admitted requests still reading their uploads count as queued too,
+        # minus those that will start right away in a free slot.
+        free_slots = max(0, self.max_concurrency - self.active)
+        if self._pending >= self.max_queue + free_slots:
+            raise AdmissionError("queue_full", self.estimated_wait(self._pending + 1))
+        estimate = self.estimated_wait(self._pending + 1)
+        if estimate > self.max_wait_seconds:
+            raise AdmissionError("rate_limited", estimate)
+        self._pending += 1
+        return Ticket()
+
+    async def wait(self, ticket: Ticket, cost: int = 1) -> AsyncGenerator[dict, None]:
+        """
+        Queues the ticket and yields progress payloads with its queue position
+        and estimated wait until it is allowed to run.
+        """
+
+        ticket.cost = max(1, cost)
+        ticket.queued = True
+        self._waiting.append(ticket)
+        self._dispatch()
+
+        last_position = None
+        while not ticket.granted.is_set():
+            position = self._waiting.index(ticket) + 1
+            if position != last_position:
+                last_position = position
+                yield {
+                    "message": "queued",
+                    "queue_position": position,
+                    "estimated_wait_seconds": round(self.estimated_wait(position), 1),
+                }
+            ticket.changed.clear()
+            try:
+                await asyncio.wait_for(ticket.changed.wait(), PROGRESS_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                last_position = None  # re-announce so the client sees we are alive
+
+    async def charge(self, cost: int = 1, max_wait: float | None = None) -> None:
+        """
+        Takes `cost` more LLM requests from the rate buckets on behalf of a
+        request that already holds a slot (retries, escalations), waiting
+        until they are available. Raises AdmissionError instead when that
+        would take longer than max_wait (default max_wait_seconds).
+        """
+
+        max_wait = self.max_wait_seconds if max_wait is None else max_wait
+        while True:
+            delay = max((bucket.time_until(cost) for bucket in self.buckets), default=0.0)
+            if delay <= 0:
+                break
+            if delay > max_wait:
+                raise AdmissionError("rate_limited", delay)
+            await asyncio.sleep(delay)
+        for bucket in self.buckets:
+            bucket.take(cost)
+
+    def release(self, ticket: Ticket) -> None:
+        """
+        Frees the ticket's slot or queue place. Safe to call more than once.
+        """
+
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.granted.is_set():
+            self.active -= 1
+            elapsed = time.monotonic() - ticket.started_at
+            self.service_seconds = 0.8 * self.service_seconds + 0.2 * elapsed
+        else:
+            self._pending -= 1
+            if ticket.queued:
+                self._waiting.remove(ticket)
+        self._dispatch()
+
+    def estimated_wait(self, position: int) -> float:
+        """
+        Rough wait for the request at 1-based queue `position`: the larger of
+        the concurrency-bound estimate and the rate-limit-bound one.
+        """
+
+        free_slots = self.max_concurrency - self.active
+        ahead = position - max(0, free_slots)
+        by_concurrency = max(0, math.ceil(ahead / self.max_concurrency)) * self.service_seconds
+        by_rate = max((bucket.time_until(position) for bucket in self.buckets), default=0.0)
+        return max(by_concurrency, by_rate)
+
+    def _dispatch(self) -> None:
+        granted_any = False
+        while self._waiting and self.active < self.max_concurrency:
+            ticket = self._waiting[0]
+            delay = max((b.time_until(ticket.cost) for b in self.buckets), default=0.0)
+            if delay > 0:
+                self._schedule(delay)
+                break
+            self._waiting.popleft()
+            self._pending -= 1
+            for bucket in self.buckets:
+                bucket.take(ticket.cost)
+            self.active += 1
+            ticket.started_at = time.monotonic()
+            ticket.granted.set()
+            ticket.changed.set()
+            granted_any = True
+
+        if granted_any:
+            # everyone behind moved up
+            for ticket in self._waiting:
+                ticket.changed.set()
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import aclosing
+from typing import AsyncGenerator, AsyncIterator, Callable
+
+from app.events import serialize_event
+
+# A run whose clients all disconnected keeps going this long, so they can resume.
+RESUME_GRACE_SECONDS = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "15"))
+# Finished runs stay resumable this long; at most this many are kept.
+RESUME_TTL_SECONDS = float(os.getenv("STREAM_RESUME_TTL_SECONDS", "300"))
+RESUME_MAX_RUNS = int(os.getenv("STREAM_RESUME_MAX_RUNS", "256"))
+# Frames buffered per run; older ones are dropped first.
+RESUME_MAX_FRAMES = int(os.getenv("STREAM_RESUME_MAX_FRAMES", "512"))
+# A new run nobody has started reading after this long (or the grace period,
+# if longer) is cancelled.
+ATTACH_SECONDS = 5.0
+
+
+def request_fingerprint(image_keys: list[str], filenames: list[str], context: str | None, mode: str) -> str:
+    """
+    Identifies a validation request by its ordered image hashes plus the
+    inputs that change the emitted events (screenshot ids, context, mode).
+    """
+
+    h = hashlib.sha256()
+    for key, name in zip(image_keys, filenames):
+        h.update(key.encode())
+        h.update(b"\0")
+        h.update(name.encode())
+        h.update(b"\0")
+    h.update(b"\1")
+    h.update((context or "").encode())
+    h.update(b"\1")
+    h.update(mode.encode())
+    return h.hexdigest()
+
+
+class Run:
+    """
+    One validation: a bounded buffer of the frames emitted so far plus a
+    wake-up event for subscribers waiting on the next one.
+
+    Every frame is prefixed with an SSE id line, "<run_id>:<seq>", so a client
+    that lost the connection can resume after the last frame it saw.
+    """
+
+    def __init__(self, key: str, max_frames: int = RESUME_MAX_FRAMES):
+        self.key = key
+        self.run_id = uuid.uuid4().hex
+        self.frames: deque[bytes] = deque(maxlen=max_frames)
+        self.next_seq = 0  # seq of the next published frame
+        self.done = False
+        self.finished_at = 0.0
+        self.subscribers = 0
+        self.task: asyncio.Task | None = None
+        self._changed = asyncio.Event()
+        self._id_prefix = f"id: {self.run_id}:".encode()
+
+    @property
+    def first_seq(self) -> int:
+        """
+        Seq of the oldest frame still buffered.
+        """
+
+        return self.next_seq - len(self.frames)
+
+    def publish(self, frame: bytes) -> None:
+        self.frames.append(self._id_prefix + str(self.next_seq).encode() + b"\n" + frame)
+        self.next_seq += 1
+        self._notify()
+
+    def finish(self) -> None:
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, after: int = -1) -> AsyncGenerator[bytes, None]:
+        """
+        Replays the buffered frames with a seq above after, then the live ones
+        until the run ends. Frames already evicted from the buffer are
+        reported once with a resume_gap event.
+        """
+
+        seq = after + 1
+        while True:
+            if seq < self.first_seq:
+                yield serialize_event("progress", {"message": "resume_gap", "missed": self.first_seq - seq})
+                seq = self.first_seq
+            while seq < self.next_seq:
+                yield self.frames[seq - self.first_seq]
+                seq += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+def parse_event_id(event_id: str | None) -> tuple[str, int] | None:
+    """
+    Splits a Last-Event-ID value "<run_id>:<seq>" into its parts.
+    """
+
+    run_id, sep, seq = (event_id or "").strip().rpartition(":")
+    if not sep or not seq.isdigit():
+        return None
+    return run_id, int(seq)
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests: the first request for a key
+    starts the producer in its own task, later ones attach as subscribers.
+
+    Runs stay reachable by run id so dropped clients can resume: a run whose
+    last subscriber leaves is only cancelled after a grace period, and a
+    finished run's buffer is kept for RESUME_TTL_SECONDS (at most
+    RESUME_MAX_RUNS of them).
+    """
+
+    def __init__(
+        self,
+        grace_seconds: float = RESUME_GRACE_SECONDS,
+        ttl_seconds: float = RESUME_TTL_SECONDS,
+        max_finished: int = RESUME_MAX_RUNS,
+    ):
+        self.grace_seconds = grace_seconds
+        self.ttl_seconds = ttl_seconds
+        self.max_finished = max_finished
+        self._runs: dict[str, Run] = {}  # in flight, by fingerprint
+        self._by_id: dict[str, Run] = {}  # in flight, by run id
+        self._finished: OrderedDict[str, Run] = OrderedDict()
+        self.coalesced = 0
+
+    def subscribe(
+        self,
+        key: str,
+        producer: Callable[[], AsyncIterator[bytes]],
+    ) -> tuple[AsyncGenerator[bytes, None], bool]:
+        """
+        Attaches to the run for key, starting it with producer() if none is in
+        flight. Returns the frame stream and whether a new run was started.
+        The run is registered before this returns, so concurrent callers can
+        never start the same run twice; the caller counts as a subscriber once
+        it starts iterating, and a new run nobody reads is cancelled like an
+        abandoned one.
+        """
+
+        self._evict()
+        run = self._runs.get(key)
+        started = run is None
+        if started:
+            run = Run(key)
+            self._runs[key] = run
+            self._by_id[run.run_id] = run
+            run.task = asyncio.create_task(self._drive(run, producer()))
+            # a response closed before its first iteration never attaches
+            asyncio.get_running_loop().call_later(
+                max(self.grace_seconds, ATTACH_SECONDS), self._cancel_if_abandoned, run
+            )
+        else:
+            self.coalesced += 1
+        return self._stream(run), started
+
+    def resume(self, run_id: str, after: int = -1) -> AsyncGenerator[bytes, None] | None:
+        """
+        Follows a live or recently finished run from the frame after seq
+        after, or returns None if the run is unknown or expired.
+        """
+
+        self._evict()
+        run = self._by_id.get(run_id) or self._finished.get(run_id)
+        if run is None:
+            return None
+        return self._stream(run, after)
+
+    async def _stream(self, run: Run, after: int = -1) -> AsyncGenerator[bytes, None]:
+        # attaches once iterated: a generator closed before it starts never
+        # runs its finally, so counting earlier would leak the subscriber
+        run.subscribers += 1
+        try:
+            async for frame in run.follow(after):
+                yield frame
+        finally:
+            run.subscribers -= 1
+            if run.subscribers == 0 and not run.done:
+                if self.grace_seconds > 0:
+                    asyncio.get_running_loop().call_later(self.grace_seconds, self._cancel_if_abandoned, run)
+                else:
+                    run.task.cancel()
+
+    @staticmethod
+    def _cancel_if_abandoned(run: Run) -> None:
+        if run.subscribers == 0 and not run.done:
+            run.task.cancel()
+
+    async def _drive(self, run: Run, frames: AsyncIterator[bytes]) -> None:
+        try:
+            async with aclosing(frames):
+                async for frame in frames:
+                    run.publish(frame)
+        finally:
+            run.finish()
+            if self._runs.get(run.key) is run:
+                del self._runs[run.key]
+            self._by_id.pop(run.run_id, None)
+            self._finished[run.run_id] = run
+            self._evict()
+
+    def _evict(self) -> None:
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._finished:
+            run = next(iter(self._finished.values()))
+            if len(self._finished) <= self.max_finished and run.finished_at > deadline:
+                break
+            self._finished.popitem(last=False)
@@ -0,0 +1,99 @@
+import math
+import os
+
+import numpy as np
+from PIL import Image
+
+# Gemini bills an image as 258 tokens if both sides are <= 384 px, otherwise
+# 258 tokens per 768x768 tile it is cut into.
+TOKENS_PER_TILE = 258
+SMALL_IMAGE_PX = 384
+TILE_PX = 768
+
+# Height, in output pixels, the smallest text line is kept at.
+MIN_TEXT_PX = int(os.getenv("IMAGE_MIN_TEXT_PX", "10"))
+
+# Pixels differing from the background by more than this count as content.
+_INK_THRESHOLD = 40
+# Row runs taller than this are pictures or cards, not text lines.
+_MAX_LINE_PX = 80
+_MIN_LINE_PX = 3
+_CROP_PADDING_PX = 8
+
+
+def estimate_tokens(w: int, h: int) -> int:
+    if w <= SMALL_IMAGE_PX and h <= SMALL_IMAGE_PX:
+        return TOKENS_PER_TILE
+    return math.ceil(w / TILE_PX) * math.ceil(h / TILE_PX) * TOKENS_PER_TILE
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """
+    Lengths of the runs of True in a 1D boolean array.
+    """
+
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+
+
+def analyse_layout(img: Image.Image) -> tuple[tuple[int, int, int, int], float | None]:
+    """
+    Returns the bounding box of the screenshot's content and the height of
+    its smaller text lines in pixels (None when no text-like rows are found).
+
+    Rows and columns of a single colour (margins, empty app bars, frame
+    lines) don't count as content, so uniform borders and chrome are cropped.
+    """
+
+    gray = np.asarray(img.convert("L"), dtype=np.int16)
+    h, w = gray.shape
+
+    # A column is flat if it is one colour over the rows that carry content;
+    # rows are judged the same way over non-flat columns, and vice versa.
+    busy_cols = np.ptp(gray, axis=0) > _INK_THRESHOLD
+    busy_rows = np.ptp(gray[:, busy_cols], axis=1) > _INK_THRESHOLD if busy_cols.any() else np.zeros(h, bool)
+    rows = np.flatnonzero(busy_rows)
+    if rows.size == 0:
+        return (0, 0, w, h), None
+    cols = np.flatnonzero(np.ptp(gray[rows], axis=0) > _INK_THRESHOLD)
+    box = (
+        int(max(0, cols[0] - _CROP_PADDING_PX)),
+        int(max(0, rows[0] - _CROP_PADDING_PX)),
+        int(min(w, cols[-1] + 1 + _CROP_PADDING_PX)),
+        int(min(h, rows[-1] + 1 + _CROP_PADDING_PX)),
+    )
+
+    # Text lines are runs of rows with some, but not mostly, off-background
+    # pixels; vertical rules are left out so they don't join every row.
+    content = gray[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    background = int(np.median(content))
+    ink = np.abs(content - background) > _INK_THRESHOLD
+    ink = ink[:, ink.mean(axis=0) < 0.5]
+    if ink.shape[1] == 0:
+        # noise or a dark picture: no column looks like text on a background
+        return box, None
+    fill = ink.mean(axis=1)
+    lines = _runs((fill > 0) & (fill < 0.9))
+    lines = lines[(lines >= _MIN_LINE_PX) & (lines <= _MAX_LINE_PX)]
+    # the lower quartile stands for the small print (prices, dates in footnotes)
+    line_height = float(np.percentile(lines, 25)) if lines.size else None
+    return box, line_height
+
+
+def choose_width(w: int, h: int, line_height: float | None, max_width: int) -> int:
+    """
+    Picks the output width: the smallest scale that keeps text lines at
+    least MIN_TEXT_PX tall sets the token cost, then the image is grown to
+    the largest size with that same cost (and at most max_width), since the
+    extra detail is free.
+    """
+
+    ceiling = min(1.0, max_width / w)
+    floor = ceiling if line_height is None else min(ceiling, MIN_TEXT_PX / line_height)
+    if max(w, h) * floor <= SMALL_IMAGE_PX:
+        scale = SMALL_IMAGE_PX / max(w, h)
+    else:
+        cols = math.ceil(w * floor / TILE_PX)
+        rows = math.ceil(h * floor / TILE_PX)
+        scale = min(cols * TILE_PX / w, rows * TILE_PX / h)
+    return max(1, int(w * min(scale, ceiling)))
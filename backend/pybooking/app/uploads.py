@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+
+from app.metrics import IMAGE_BYTES, STAGE_SECONDS
+from app.preprocess import submit_compress
+
+UPLOAD_CHUNK_BYTES = 256 * 1024
+MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(60 * 1024 * 1024)))
+
+# Leading bytes of the image formats PIL can decode for us.
+_IMAGE_SIGNATURES = (
+    b"\x89PNG\r\n\x1a\n",
+    b"\xff\xd8\xff",  # JPEG
+    b"GIF87a",
+    b"GIF89a",
+    b"BM",
+    b"II*\x00",  # TIFF little-endian
+    b"MM\x00*",  # TIFF big-endian
+)
+
+
+class UploadRejected(Exception):
+    """
+    Raised for uploads that are refused outright; carries the HTTP status.
+    """
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class IncomingImage:
+    """
+    An uploaded screenshot after ingestion: the raw bytes are gone, only
+    their hash and the pending compressed JPEG (a PreparedImage) remain.
+    """
+
+    filename: str
+    key: str
+    size: int
+    compressed: asyncio.Future
+
+
+@dataclass
+class IngestResult:
+    images: list[IncomingImage] = field(default_factory=list)
+    errors: list[dict] = field(default_factory=list)
+    bytes_received: int = 0
+    peak_buffered_bytes: int = 0
+
+
+def is_image(head: bytes) -> bool:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return True
+    return head.startswith(_IMAGE_SIGNATURES)
+
+
+async def ingest_uploads(
+    files: list[UploadFile],
+    max_file_bytes: int = MAX_FILE_BYTES,
+    max_request_bytes: int = MAX_REQUEST_BYTES,
+) -> IngestResult:
+    """
+    Reads uploads chunk by chunk, hashing as it goes and enforcing size caps
+    and an image signature check on the first chunk. Each file is handed to
+    the preprocessing pool as soon as it has fully arrived, so compression of
+    earlier files overlaps with reading later ones, and its raw bytes are
+    dropped here once submitted.
+    """
+
+    result = IngestResult()
+    buffered = 0  # raw bytes currently held by this request
+    try:
+        for file in files:
+            name = file.filename or str(uuid.uuid4())
+            chunks: list[bytes] = []
+            digest = hashlib.sha256()
+            size = 0
+            try:
+                while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                    if size == 0 and not is_image(chunk):
+                        raise UploadRejected(415, f"unsupported_file_type: {name}")
+                    size += len(chunk)
+                    result.bytes_received += len(chunk)
+                    if size > max_file_bytes:
+                        raise UploadRejected(413, f"file_too_large: {name} exceeds {max_file_bytes} bytes")
+                    if result.bytes_received > max_request_bytes:
+                        raise UploadRejected(413, f"request_too_large: uploads exceed {max_request_bytes} bytes")
+                    digest.update(chunk)
+                    chunks.append(chunk)
+                    buffered += len(chunk)
+                    result.peak_buffered_bytes = max(result.peak_buffered_bytes, buffered)
+            except UploadRejected:
+                raise
+            except Exception as exc:
+                result.errors.append({"message": f"file_read_error: {file.filename}", "error": str(exc)})
+                buffered -= sum(len(c) for c in chunks)
+                continue
+            finally:
+                await file.close()
+
+            if size == 0:
+                result.errors.append({"message": f"empty_file: {name}"})
+                continue
+
+            raw = b"".join(chunks)
+            # chunks and the joined copy coexist for a moment
+            result.peak_buffered_bytes = max(result.peak_buffered_bytes, buffered + size)
+            del chunks
+            compressed = submit_compress(raw)
+            compressed.add_done_callback(_compression_observer(size))
+            result.images.append(IncomingImage(filename=name, key=digest.hexdigest(), size=size, compressed=compressed))
+            # from here on only the compression task references the raw bytes,
+            # and it drops them once the compressed JPEG exists
+            del raw
+            buffered -= size
+    except BaseException:
+        discard(result.images)
+        raise
+    return result
+
+
+def _compression_observer(raw_size: int):
+    """
+    Done-callback recording compression latency (including time queued for a
+    pool worker) and the byte counts before and after.
+    """
+
+    started = time.perf_counter()
+
+    def observe(future: asyncio.Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        STAGE_SECONDS.labels("compress").observe(time.perf_counter() - started)
+        IMAGE_BYTES.labels("raw").inc(raw_size)
+        IMAGE_BYTES.labels("compressed").inc(len(future.result().jpeg))
+
+    return observe
+
+
+def discard(images: list[IncomingImage]) -> None:
+    """
+    Drops pending compressions that are no longer needed.
+    """
+
+    for image in images:
+        image.compressed.cancel()
+
+
+class RequestSizeLimit:
+    """
+    ASGI middleware that refuses POSTs to `path` whose declared
+    Content-Length exceeds `max_bytes` before the multipart body is parsed
+    and spooled.
+    """
+
+    def __init__(self, app, path: str = "/stream", max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.path = path
+        # multipart framing adds a little on top of the file bytes
+        self.max_bytes = max_bytes + 64 * 1024
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == self.path:
+            for name, value in scope["headers"]:
+                if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                    response = JSONResponse(
+                        {"detail": f"request_too_large: uploads exceed {self.max_bytes} bytes"},
+                        status_code=413,
+                    )
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable
+
+from fastapi import FastAPI
+
+from app.instruction_cache import instruction_cache
+from app.llm_client import LLM_BACKEND, MODEL, build_prompt_parts, close_client, create_client, prime_instruction_cache
+from app.preprocess import warm_pool
+
+# "0" skips the request that opens the model client's connection at startup.
+WARMUP_CONNECT = os.getenv("WARMUP_CONNECT", "1") != "0"
+WARMUP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("WARMUP_CONNECT_TIMEOUT_SECONDS", "5"))
+
+
+class Warmup:
+    """
+    Startup work done in the background once the server is listening:
+    importing and creating the model client, building the prompt Parts,
+    spawning the preprocessing workers, opening the model connection and
+    caching the instruction prefixes.
+
+    Each step records its duration and error; a failed step doesn't stop the
+    others (requests report a missing client as a progress event). The app is
+    ready once every step has finished.
+    """
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+        app.state.llm_client = None
+        self.status = "pending"
+        self.steps: dict[str, dict] = {}
+        self.started_at = 0.0
+        self.seconds: float | None = None
+        self.client_ready = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        self.status = "running"
+        self.started_at = time.perf_counter()
+        try:
+            await self._step("llm_client", self._create_client)
+        finally:
+            self.client_ready.set()
+        await asyncio.gather(
+            self._step("prompt_parts", lambda: asyncio.to_thread(build_prompt_parts)),
+            self._step("preprocess_pool", warm_pool),
+            self._step("llm_connection", self._connect),
+            self._step("instruction_cache", lambda: prime_instruction_cache(self.app.state.llm_client)),
+        )
+        self.seconds = round(time.perf_counter() - self.started_at, 3)
+        self.status = "ready"
+
+    async def stop(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        client = getattr(self.app.state, "llm_client", None)
+        if client is not None:
+            await instruction_cache.close(client)
+            await close_client(client)
+
+    async def _step(self, name: str, fn: Callable[[], Awaitable]) -> None:
+        step = self.steps[name] = {"status": "running"}
+        started = time.perf_counter()
+        try:
+            result = await fn()
+        except Exception as exc:
+            step.update(status="error", error=str(exc) or type(exc).__name__)
+        else:
+            step["status"] = "skipped" if result is False else "done"
+        step["seconds"] = round(time.perf_counter() - started, 3)
+
+    async def _create_client(self) -> None:
+        # importing google.genai is most of the cold start, keep it off the loop
+        self.app.state.llm_client = await asyncio.to_thread(create_client)
+
+    async def _connect(self) -> bool:
+        client = self.app.state.llm_client
+        if not WARMUP_CONNECT or client is None or LLM_BACKEND == "fake":
+            return False
+        # any cheap call opens the pooled TLS connection the first request reuses
+        await asyncio.wait_for(client.aio.models.get(model=MODEL), WARMUP_CONNECT_TIMEOUT_SECONDS)
+        return True
+
+    def report(self) -> dict:
+        return {
+            "status": self.status,
+            "seconds": self.seconds,
+            "steps": self.steps,
+        }
+
+
+async def llm_client(app: FastAPI):
+    """
+    The shared model client, waiting for warm-up to create it if a request
+    arrives first. None if it couldn't be created.
+    """
+
+    await app.state.warmup.client_ready.wait()
+    return app.state.llm_client
@@ -0,0 +1,81 @@
+"""
+Micro-benchmark: comparing many bookings with compare_fields one by one
+(plus model_dump for the NDJSON output) against the columnar
+comparison_rows used by /batch, and checking both agree.
+
+Run from backend/pybooking:
+
+    python -m bench.bench_compare
+"""
+
+import argparse
+import random
+import time
+
+from app.compare_columnar import comparison_rows
+from app.compare_fields import compare_fields
+from app.models.models import ScreenshotResult
+
+HOTELS = ["Hotel Example", "Hotel Example Downtown", "unclear"]
+DATES = ["2025-06-01", "2025-06-02", "unclear"]
+GUESTS = [2, 3, "unclear"]
+PRICES = [480.0, 480.5, "unclear"]
+CLASSIFICATIONS = ["initial_quote", "initial_quote", "final_booking", "final_booking", "unknown"]
+
+
+def random_bookings(n: int, seed: int) -> list[list[ScreenshotResult]]:
+    rng = random.Random(seed)
+    bookings = []
+    for _ in range(n):
+        screenshots = []
+        for i in range(rng.randint(1, 5)):
+            screenshots.append(ScreenshotResult.model_validate({
+                "screenshot_id": f"screenshot_{i}.png",
+                "classification": rng.choice(CLASSIFICATIONS),
+                "extraction": {
+                    "hotel_name": rng.choice(HOTELS),
+                    "check_in": rng.choice(DATES),
+                    "check_out": rng.choice(DATES),
+                    "guests": rng.choice(GUESTS),
+                    "total_price": rng.choice(PRICES),
+                },
+            }))
+        bookings.append(screenshots)
+    return bookings
+
+
+def looped(bookings: list[list[ScreenshotResult]]) -> list[list[dict]]:
+    return [[c.model_dump(mode="json") for c in compare_fields(b)] for b in bookings]
+
+
+def timeit(fn, bookings, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(bookings)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bookings", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    bookings = random_bookings(args.bookings, args.seed)
+    if looped(bookings) != comparison_rows(bookings):
+        raise SystemExit("comparison_rows disagrees with compare_fields")
+
+    loop_s = timeit(looped, bookings, args.repeat)
+    columnar_s = timeit(comparison_rows, bookings, args.repeat)
+    print(f"{len(bookings)} bookings, {sum(map(len, bookings))} screenshots (results identical)")
+    print(f"{'path':28} {'bookings/s':>12}")
+    print(f"{'compare_fields + model_dump':28} {len(bookings) / loop_s:12,.0f}")
+    print(f"{'comparison_rows':28} {len(bookings) / columnar_s:12,.0f}")
+    print(f"speedup {loop_s / columnar_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Micro-benchmark: events per second through /stream's forwarding loop
+(normalize, validate, serialize to an SSE frame), comparing the previous
+model_validate + json.dumps path with app/events.py.
+
+Run from backend/pybooking:
+
+    python -m bench.bench_events
+"""
+
+import argparse
+import copy
+import json
+import time
+from pathlib import Path
+
+from app.events import serialize_event, validate_event
+from app.models.models import ScreenshotResult, StreamEvent
+from app.ndjson import NDJSONDecoder
+
+RECORDINGS = Path(__file__).parent / "recordings"
+
+
+def legacy_serialize(event_type: str, payload: dict) -> bytes:
+    return f"data: {json.dumps({'type': event_type, 'payload': payload}, default=str)}\n\n".encode("utf-8")
+
+
+def legacy_validate(raw_event: dict) -> ScreenshotResult | None:
+    """
+    The route used to validate every event as a StreamEvent and then
+    extraction payloads a second time as a ScreenshotResult.
+    """
+
+    StreamEvent.model_validate(raw_event)
+    if raw_event["type"] == "extraction":
+        try:
+            return ScreenshotResult.model_validate(raw_event["payload"]["screenshot"])
+        except Exception:
+            return None
+    return None
+
+
+def forward(events: list[dict], validate, serialize) -> int:
+    """
+    The body of validation_run's event loop, minus caching and metrics.
+    """
+
+    frames = 0
+    screenshots = []
+    for raw_event in events:
+        if "type" not in raw_event and "event_type" in raw_event:
+            raw_event["type"] = raw_event.pop("event_type")
+        event_type = raw_event.get("type")
+        if event_type == "progress":
+            serialize("progress", raw_event.get("payload", {"message": "progress"}))
+            frames += 1
+            continue
+        try:
+            screenshot = validate(raw_event)
+        except Exception:
+            continue
+        serialize(event_type, raw_event["payload"])
+        frames += 1
+        if screenshot is not None:
+            screenshots.append(screenshot)
+    return frames
+
+
+def recorded_events() -> list[dict]:
+    events = []
+    for path in sorted(RECORDINGS.glob("*.ndjson")):
+        decoder = NDJSONDecoder()
+        events += decoder.feed(path.read_text()) + decoder.close()
+    return events
+
+
+def timeit(validate, serialize, events: list[dict], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        batch = copy.deepcopy(events)
+        start = time.perf_counter()
+        forward(batch, validate, serialize)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=20_000, help="events pushed through the loop per run")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sample = recorded_events()
+    events = (sample * (args.events // len(sample) + 1))[:args.events]
+    kinds = {ev["type"] for ev in sample}
+
+    legacy_s = timeit(legacy_validate, legacy_serialize, events, args.repeat)
+    new_s = timeit(validate_event, serialize_event, events, args.repeat)
+    print(f"{len(events)} events ({', '.join(sorted(kinds))})")
+    print(f"{'path':24} {'events/s':>12}")
+    print(f"{'model_validate + json':24} {len(events) / legacy_s:12,.0f}")
+    print(f"{'TypeAdapter + orjson':24} {len(events) / new_s:12,.0f}")
+    print(f"speedup {legacy_s / new_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Micro-benchmark: the NDJSON decoder used by llm_stream against the previous
+`buffer += txt; buffer.split("\\n", 1)` loop, on the recorded Gemini outputs
+in bench/recordings and on a synthetic long-line stream.
+
+Run from backend/pybooking:
+
+    python -m bench.bench_ndjson
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from app.ndjson import NDJSONDecoder
+
+RECORDINGS = Path(__file__).parent / "recordings"
+
+
+def legacy_decode(chunks: list[str]) -> list[dict]:
+    """
+    The chunk loop llm_stream used before app/ndjson.py.
+    """
+
+    out = []
+    buffer = ""
+    for txt in chunks:
+        buffer += txt
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            line = line.strip()
+            if not line or line == "[DONE]":
+                continue
+            try:
+                out.append(json.loads(line))
+            except Exception:
+                pass
+    if buffer.strip():
+        try:
+            out.append(json.loads(buffer.strip()))
+        except Exception:
+            pass
+    return out
+
+
+def incremental_decode(chunks: list[str]) -> list[dict]:
+    decoder = NDJSONDecoder()
+    out = []
+    for txt in chunks:
+        out.extend(decoder.feed(txt))
+    out.extend(decoder.close())
+    return out
+
+
+def chunked(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def long_line_stream(line_bytes: int) -> str:
+    """
+    One extraction event whose explanation makes a single very long line.
+    """
+
+    event = {"type": "comparison", "payload": {"field": "hotel_name", "explanation": "x" * line_bytes}}
+    return json.dumps(event) + "\n"
+
+
+def timeit(fn, chunks: list[str], repeat: int) -> tuple[float, int]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        objects = fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    return best, len(objects)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunk-size", type=int, default=96, help="characters per simulated stream chunk")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cases = [(path.name, path.read_text()) for path in sorted(RECORDINGS.glob("*.ndjson"))]
+    cases += [(f"long_line_{size // 1000}k", long_line_stream(size)) for size in (50_000, 200_000, 800_000)]
+
+    print(f"{'case':32} {'legacy ms':>10} {'objs':>5} {'new ms':>10} {'objs':>5} {'speedup':>8}")
+    for name, text in cases:
+        chunks = chunked(text, args.chunk_size)
+        repeat = args.repeat if len(text) < 100_000 else 3
+        legacy_s, legacy_n = timeit(legacy_decode, chunks, repeat)
+        new_s, new_n = timeit(incremental_decode, chunks, repeat)
+        print(
+            f"{name:32} {legacy_s * 1000:10.3f} {legacy_n:5d} {new_s * 1000:10.3f} {new_n:5d} "
+            f"{legacy_s / new_s:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+Offline load benchmark for the /stream pipeline, driven against the replay
+LLM in bench/replay.py with the PNGs in images/ as upload fixtures.
+
+Reports time-to-first-event, time-to-first-extraction, time-to-final and
+throughput for N concurrent uploads, plus wall time and peak Python heap per
+stage (upload ingestion, LLM stream decoding, compare_fields, end to end).
+Results can be stored as a baseline and later runs compared against it.
+
+Run from backend/pybooking:
+
+    python -m bench.bench_stream
+    python -m bench.bench_stream --save-baseline
+    python -m bench.bench_stream --compare
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+# The replay client replaces the app's client after startup; never build a
+# real Gemini client (it needs an API key) in the meantime.
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from app.cache import extraction_cache
+from app.compare_fields import compare_fields
+from app.llm_client import close_client, llm_stream
+from app.main import app
+from app.models.models import ScreenshotResult
+from app.preprocess import shutdown_pool
+from app.scheduler import Scheduler
+from app.uploads import ingest_uploads
+from bench.replay import ReplayGeminiClient
+
+IMAGES = Path(__file__).resolve().parents[3] / "images"
+BASELINE = Path(__file__).parent / "baseline.json"
+
+# fixture set -> (uploaded images, recording replayed for them)
+FIXTURES = {
+    "match": (["initial_clear.png", "final_clear.png"], "match_two_screenshots.ndjson"),
+    "mismatch": (["initial_clear.png", "final_mismatch_price.png"], "mismatch_noisy.ndjson"),
+    "unclear": (["blurry_unclear.png", "final_clear.png"], "unclear_blurry.ndjson"),
+}
+
+# Metrics compared against the baseline; all are "lower is better".
+TRACKED = (
+    "ttfe_p50_ms",
+    "ttfe_p95_ms",
+    "first_extraction_p50_ms",
+    "first_extraction_p95_ms",
+    "final_p50_ms",
+    "final_p95_ms",
+    "stage.ingest.ms",
+    "stage.ingest.peak_kb",
+    "stage.llm_stream.ms",
+    "stage.llm_stream.peak_kb",
+    "stage.compare_fields.ms",
+    "stage.compare_fields.peak_kb",
+    "stage.end_to_end.peak_kb",
+)
+
+
+def load_fixture(name: str) -> list[tuple[str, bytes]]:
+    images, _ = FIXTURES[name]
+    return [(filename, (IMAGES / filename).read_bytes()) for filename in images]
+
+
+def unique_copy(files: list[tuple[str, bytes]], salt: int) -> list[tuple[str, bytes]]:
+    """
+    Appends bytes after the image end marker (decoders ignore them) so every
+    request hashes differently and neither the extraction cache nor
+    single-flight coalescing hides the work being measured.
+    """
+
+    return [(name, data + salt.to_bytes(8, "big")) for name, data in files]
+
+
+def multipart(files: list[tuple[str, bytes]], fields: dict[str, str]) -> tuple[bytes, str]:
+    boundary = "benchboundary7d1a"
+    out = BytesIO()
+    for name, value in fields.items():
+        out.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for filename, data in files:
+        out.write(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+            f"Content-Type: image/png\r\n\r\n".encode()
+        )
+        out.write(data)
+        out.write(b"\r\n")
+    out.write(f"--{boundary}--\r\n".encode())
+    return out.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+def event_types(chunk: bytes) -> list[str]:
+    """
+    Types of the SSE events in a body chunk, read from their data lines
+    (independent of how the JSON is spaced).
+    """
+
+    types = []
+    for line in chunk.splitlines():
+        if line.startswith(b"data:"):
+            try:
+                types.append(json.loads(line[len(b"data:"):]).get("type"))
+            except ValueError:
+                types.append(None)
+    return types
+
+
+async def post_stream(body: bytes, content_type: str) -> dict:
+    """
+    Drives the ASGI app directly and timestamps every body frame, which an
+    HTTP client that buffers the response could not do.
+    """
+
+    start = time.perf_counter()
+    result = {"status": None, "ttfe": None, "extraction": None, "final": None, "events": 0}
+    sent = False
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        now = time.perf_counter() - start
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            types = event_types(message.get("body", b""))
+            if types:
+                result["events"] += len(types)
+                if result["ttfe"] is None:
+                    result["ttfe"] = now
+                if result["extraction"] is None and "extraction" in types:
+                    result["extraction"] = now
+                if "final" in types:
+                    result["final"] = now
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/stream",
+        "raw_path": b"/stream",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("bench", 0),
+        "server": ("bench", 80),
+        "app": app,
+    }
+    try:
+        await app(scope, receive, send)
+    finally:
+        done.set()
+    return result
+
+
+async def use_client(client) -> None:
+    # warm-up sets app.state.llm_client in the background; let it finish
+    # first, or it replaces the client installed here
+    await app.state.warmup.task
+    if app.state.llm_client is not None and app.state.llm_client is not client:
+        await close_client(app.state.llm_client)
+    app.state.llm_client = client
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run_load(args) -> dict:
+    """
+    Fires args.requests uploads of the chosen fixture set, args.concurrency at a time.
+    """
+
+    replay = ReplayGeminiClient(
+        recording=FIXTURES[args.fixture][1],
+        chunk_latency=args.chunk_latency,
+        jitter=args.jitter,
+        first_chunk_delay=args.first_chunk_delay,
+    )
+    await use_client(replay)
+    app.state.scheduler = Scheduler(
+        max_concurrency=args.concurrency,
+        max_queue=args.requests,
+        requests_per_minute=0,
+        requests_per_day=0,
+    )
+    extraction_cache.clear()
+
+    files = load_fixture(args.fixture)
+    bodies = [multipart(unique_copy(files, i), {"mode": args.mode}) for i in range(args.requests)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(body):
+        async with semaphore:
+            return await post_stream(*body)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(body) for body in bodies))
+    wall = time.perf_counter() - start
+
+    ttfe = [r["ttfe"] * 1000 for r in results if r["ttfe"] is not None]
+    extraction = [r["extraction"] * 1000 for r in results if r["extraction"] is not None]
+    final = [r["final"] * 1000 for r in results if r["final"] is not None]
+    return {
+        "requests": args.requests,
+        "failed": sum(r["status"] != 200 or r["final"] is None for r in results),
+        "upstream_calls": replay.calls,
+        "ttfe_p50_ms": round(percentile(ttfe, 50), 2),
+        "ttfe_p95_ms": round(percentile(ttfe, 95), 2),
+        "first_extraction_p50_ms": round(percentile(extraction, 50), 2),
+        "first_extraction_p95_ms": round(percentile(extraction, 95), 2),
+        "final_p50_ms": round(percentile(final, 50), 2),
+        "final_p95_ms": round(percentile(final, 95), 2),
+        "throughput_rps": round(args.requests / wall, 2),
+    }
+
+
+async def stage_ingest(files: list[tuple[str, bytes]]) -> None:
+    uploads = [
+        UploadFile(BytesIO(data), filename=name, headers=Headers({"content-type": "image/png"}))
+        for name, data in files
+    ]
+    ingest = await ingest_uploads(uploads)
+    await asyncio.gather(*(image.compressed for image in ingest.images))
+
+
+async def stage_llm_stream(client: ReplayGeminiClient, files: list[tuple[str, bytes]]) -> None:
+    names = [name for name, _ in files]
+    async for _ in llm_stream([data for _, data in files], names, client=client):
+        pass
+
+
+async def stage_compare_fields(screenshots: list[ScreenshotResult]) -> None:
+    for _ in range(200):
+        compare_fields(screenshots)
+
+
+async def measure(stage, repeat: int) -> dict:
+    """
+    Best-of-`repeat` wall time, then one extra run under tracemalloc for the peak heap.
+    """
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await stage()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    await stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ms": round(best * 1000, 3), "peak_kb": round(peak / 1024, 1)}
+
+
+async def run_stages(args) -> dict:
+    files = load_fixture(args.fixture)
+    instant = ReplayGeminiClient(
+        recording=FIXTURES[args.fixture][1], chunk_latency=0, jitter=0, first_chunk_delay=0
+    )
+    screenshots = [
+        ScreenshotResult.model_validate(instant.screenshot_for(name)) for name, _ in files
+    ]
+
+    stages = {
+        "ingest": await measure(lambda: stage_ingest(files), args.repeat),
+        "llm_stream": await measure(lambda: stage_llm_stream(instant, files), args.repeat),
+        "compare_fields": await measure(lambda: stage_compare_fields(screenshots), args.repeat),
+    }
+
+    # end to end: a small load run under tracemalloc
+    small = argparse.Namespace(**{**vars(args), "requests": args.concurrency})
+    tracemalloc.start()
+    await run_load(small)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stages["end_to_end"] = {"peak_kb": round(peak / 1024, 1)}
+    return stages
+
+
+def flatten(report: dict) -> dict:
+    flat = {k: v for k, v in report["load"].items()}
+    for stage, values in report["stages"].items():
+        for key, value in values.items():
+            flat[f"stage.{stage}.{key}"] = value
+    return flat
+
+
+def compare(report: dict, baseline: dict, tolerance: float, min_delta: float) -> list[str]:
+    current, previous = flatten(report), flatten(baseline)
+    regressions = []
+    # a run with failed requests has nothing meaningful to compare
+    if current.get("failed"):
+        regressions.append(f"failed: {current['failed']} of {current['requests']} requests")
+    for metric in TRACKED:
+        old, new = previous.get(metric), current.get(metric)
+        if (new is None and old is not None) or (new is not None and math.isnan(new)):
+            # NaN compares False with everything, so it would pass silently
+            regressions.append(f"{metric}: {old} -> {new} (no measurement)")
+            continue
+        if new is None or old is None or math.isnan(old) or old <= 0:
+            continue
+        # tiny absolute values (a few ms) are mostly scheduling noise
+        if new > old * (1 + tolerance) and new - old > min_delta:
+            regressions.append(f"{metric}: {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+async def main_async(args) -> dict:
+    async with app.router.lifespan_context(app):
+        load = await run_load(args)
+        stages = await run_stages(args)
+    return {"params": {k: v for k, v in vars(args).items() if k not in ("save_baseline", "compare", "tolerance", "min_delta")}, "load": load, "stages": stages}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load benchmark for /stream")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=("batch", "per_screenshot", "structured"), default="batch")
+    parser.add_argument("--fixture", choices=sorted(FIXTURES), default="match")
+    parser.add_argument("--chunk-latency", type=float, default=0.02, help="seconds between replayed chunks")
+    parser.add_argument("--jitter", type=float, default=0.01, help="+/- seconds added to each chunk delay")
+    parser.add_argument("--first-chunk-delay", type=float, default=0.3, help="simulated model time-to-first-token")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage micro-benchmark")
+    parser.add_argument("--save-baseline", action="store_true", help=f"write results to {BASELINE.name}")
+    parser.add_argument("--compare", action="store_true", help="fail if tracked metrics regress against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--min-delta", type=float, default=5.0, help="ignore regressions smaller than this (ms or KB)")
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(main_async(args))
+    finally:
+        shutdown_pool()
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"baseline written to {BASELINE}")
+    if args.compare:
+        regressions = compare(report, json.loads(BASELINE.read_text()), args.tolerance, args.min_delta)
+        if regressions:
+            print("REGRESSIONS:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("no regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Side-by-side benchmark: prompt-enforced NDJSON (llm_stream) against
+schema-constrained output (llm_stream_structured) on the replay harness.
+
+For each recording it reports the prompt text size, the model output size
+(tokens estimated at ~4 characters each), objects decoded, malformed lines
+dropped, and the time until the last extraction and until the stream ends
+at the replay's per-chunk latency.
+
+Run from backend/pybooking:
+
+    python -m bench.bench_structured
+"""
+
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+from app.fake_llm import screenshot_ids
+from app.llm_client import llm_stream, llm_stream_structured
+from app.ndjson import JSONArrayDecoder, NDJSONDecoder
+from bench.replay import RECORDINGS, ReplayGeminiClient
+
+IMAGES = Path(__file__).resolve().parents[3] / "images"
+CHARS_PER_TOKEN = 4
+
+
+class CapturingReplay(ReplayGeminiClient):
+    """
+    Replay client that remembers the prompt and the text it streamed back.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prompt_chars = 0
+        self.output = ""
+        generate = self.aio.models.generate_content_stream
+
+        async def capture(*, model: str, contents: list, config=None):
+            self.prompt_chars = sum(len(getattr(part, "text", None) or "") for part in contents)
+            ids = screenshot_ids(contents)
+            schema = getattr(config, "response_schema", None) is not None
+            self.output = self.array_for(ids) if schema else self.text_for(ids)
+            return await generate(model=model, contents=contents, config=config)
+
+        self.aio.models.generate_content_stream = capture
+
+
+async def run(llm, recording: str, images: list[bytes], names: list[str], args) -> dict:
+    client = CapturingReplay(
+        recording,
+        chunk_chars=args.chunk_chars,
+        chunk_latency=args.chunk_latency,
+        jitter=0,
+        first_chunk_delay=args.first_chunk_delay,
+    )
+    start = time.perf_counter()
+    last_extraction = 0.0
+    async for ev in llm(images, names, client=client):
+        if ev.get("type") == "extraction":
+            last_extraction = time.perf_counter() - start
+    total = time.perf_counter() - start
+
+    decoder = NDJSONDecoder() if llm is llm_stream else JSONArrayDecoder()
+    decoder.feed(client.output)
+    decoder.close()
+    return {
+        "prompt_tokens": client.prompt_chars // CHARS_PER_TOKEN,
+        "output_tokens": len(client.output) // CHARS_PER_TOKEN,
+        "objects": decoder.objects,
+        "malformed": decoder.malformed,
+        "last_extraction_ms": last_extraction * 1000,
+        "total_ms": total * 1000,
+    }
+
+
+async def main_async(args) -> None:
+    names = ["initial.png", "final.png"]
+    images = [(IMAGES / f"{n}.png").read_bytes() for n in ("initial_clear", "final_clear")]
+
+    header = f"{'recording':28} {'mode':10} {'prompt tok':>10} {'output tok':>10} {'objs':>5} {'bad':>4} {'last extr ms':>12} {'total ms':>9}"
+    print(header)
+    for path in sorted(RECORDINGS.glob("*.ndjson")):
+        for label, llm in (("ndjson", llm_stream), ("schema", llm_stream_structured)):
+            r = await run(llm, path.name, images, names, args)
+            print(
+                f"{path.name:28} {label:10} {r['prompt_tokens']:10d} {r['output_tokens']:10d} {r['objects']:5d} "
+                f"{r['malformed']:4d} {r['last_extraction_ms']:12.0f} {r['total_ms']:9.0f}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunk-chars", type=int, default=96)
+    parser.add_argument("--chunk-latency", type=float, default=0.02, help="seconds per streamed chunk")
+    parser.add_argument("--first-chunk-delay", type=float, default=0.3)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Replay stand-in for the Gemini client: plays back recorded NDJSON outputs
+from bench/recordings with configurable per-chunk latency and jitter, so
+llm_stream and the /stream route can be exercised without API quota.
+"""
+
+import asyncio
+import json
+import random
+from pathlib import Path
+
+from app.fake_llm import FakeResponse, screenshot_ids
+from app.ndjson import NDJSONDecoder
+
+RECORDINGS = Path(__file__).parent / "recordings"
+
+
+def load_recording(name: str) -> str:
+    return (RECORDINGS / name).read_text()
+
+
+def _recorded_ids(text: str) -> list[str]:
+    decoder = NDJSONDecoder()
+    events = decoder.feed(text) + decoder.close()
+    return [
+        ev["payload"]["screenshot"]["screenshot_id"]
+        for ev in events
+        if ev.get("type") == "extraction"
+    ]
+
+
+class ReplayModels:
+    def __init__(self, client: "ReplayGeminiClient"):
+        self._client = client
+
+    async def generate_content(self, *, model: str, contents: list, config=None) -> FakeResponse:
+        self._client.calls += 1
+        sid = screenshot_ids(contents)[0]
+        await asyncio.sleep(self._client.first_chunk_delay + self._client.chunk_delay())
+        return FakeResponse(json.dumps(self._client.screenshot_for(sid)))
+
+    async def generate_content_stream(self, *, model: str, contents: list, config=None):
+        self._client.calls += 1
+        ids = screenshot_ids(contents)
+        if getattr(config, "response_schema", None) is not None:
+            text = self._client.array_for(ids)
+        else:
+            text = self._client.text_for(ids)
+        size = self._client.chunk_chars
+
+        async def chunks():
+            await asyncio.sleep(self._client.first_chunk_delay)
+            for start in range(0, len(text), size):
+                await asyncio.sleep(self._client.chunk_delay())
+                yield FakeResponse(text[start:start + size])
+
+        return chunks()
+
+
+class ReplayAio:
+    def __init__(self, client: "ReplayGeminiClient"):
+        self.models = ReplayModels(client)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class ReplayGeminiClient:
+    """
+    Replays one recording for every call. The recording's screenshot ids
+    are rewritten, in order, to the ids in the request so downstream caching
+    and comparison behave as they would live.
+    """
+
+    def __init__(
+        self,
+        recording: str = "match_two_screenshots.ndjson",
+        chunk_chars: int = 96,
+        chunk_latency: float = 0.02,
+        jitter: float = 0.01,
+        first_chunk_delay: float = 0.3,
+        seed: int | None = 0,
+    ):
+        self.text = load_recording(recording)
+        self.recorded_ids = _recorded_ids(self.text)
+        self.chunk_chars = chunk_chars
+        self.chunk_latency = chunk_latency
+        self.jitter = jitter
+        self.first_chunk_delay = first_chunk_delay
+        self.calls = 0
+        self._random = random.Random(seed)
+        self.aio = ReplayAio(self)
+
+    def chunk_delay(self) -> float:
+        return max(0.0, self.chunk_latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def text_for(self, ids: list[str]) -> str:
+        text = self.text
+        for old, new in zip(self.recorded_ids, ids):
+            text = text.replace(json.dumps(old), json.dumps(new))
+        return text
+
+    def array_for(self, ids: list[str]) -> str:
+        """
+        What the model would return for the same screenshots under a list
+        response schema: the recording's extractions as one JSON array.
+        """
+
+        decoder = NDJSONDecoder()
+        shots = [
+            ev["payload"]["screenshot"]
+            for ev in decoder.feed(self.text) + decoder.close()
+            if ev.get("type") == "extraction"
+        ]
+        for shot, sid in zip(shots, ids):
+            shot["screenshot_id"] = sid
+        return json.dumps(shots, indent=2)
+
+    def screenshot_for(self, sid: str) -> dict:
+        """
+        Per-screenshot calls reuse the recorded extraction whose id best
+        matches sid (final vs initial), falling back to the first one.
+        """
+
+        decoder = NDJSONDecoder()
+        shots = [
+            ev["payload"]["screenshot"]
+            for ev in decoder.feed(self.text) + decoder.close()
+            if ev.get("type") == "extraction"
+        ]
+        wanted = "final_booking" if "final" in sid.lower() else "initial_quote"
+        shot = next((s for s in shots if s["classification"] == wanted), shots[0])
+        return {**shot, "screenshot_id": sid}
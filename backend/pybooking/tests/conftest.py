@@ -0,0 +1,78 @@
+import os
+
+# Tests never reach Gemini or a database; set before any app module is imported.
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["DATABASE_URL"] = ""
+
+import io
+import json
+import random
+
+import httpx
+import pytest
+from PIL import Image
+
+from app.cache import extraction_cache
+from app.compare_fields import FIELDS
+from app.main import app
+from app.models.models import ScreenshotResult
+
+
+def png(seed: int) -> bytes:
+    noise = random.Random(seed).randbytes(64 * 64)
+    buf = io.BytesIO()
+    Image.frombytes("L", (64, 64), noise).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def events(body: str) -> list[dict]:
+    return [
+        json.loads(line[len("data:"):])
+        for frame in body.split("\n\n")
+        for line in frame.splitlines()
+        if line.startswith("data:")
+    ]
+
+
+def upload_files(initial_seed: int, final_seed: int) -> list[tuple]:
+    # the fake LLM classifies by filename
+    return [
+        ("files", ("initial.png", png(initial_seed), "image/png")),
+        ("files", ("final.png", png(final_seed), "image/png")),
+    ]
+
+
+CHOICES = {
+    "hotel_name": ["Hotel Example", "Hotel Sample", "unclear"],
+    "check_in": ["2025-06-01", "2025-06-02", "unclear"],
+    "check_out": ["2025-06-05", "unclear"],
+    "guests": [2, 3, "unclear"],
+    "total_price": [480.0, 520.0, "unclear"],
+}
+
+
+def random_screenshot(rng: random.Random, sid: str) -> ScreenshotResult:
+    return ScreenshotResult.model_validate(
+        {
+            "screenshot_id": sid,
+            "classification": rng.choice(["initial_quote", "final_booking"]),
+            "extraction": {field: rng.choice(CHOICES[field]) for field in FIELDS},
+        }
+    )
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def client():
+    async with app.router.lifespan_context(app):
+        await app.state.warmup.client_ready.wait()
+        # slow enough that every request arrives while the first is in flight
+        app.state.llm_client.latency = 0.05
+        extraction_cache.clear()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            yield client
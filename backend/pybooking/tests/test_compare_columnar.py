@@ -0,0 +1,49 @@
+import random
+
+from app.compare_columnar import compare_bookings
+from app.compare_fields import compare_fields
+from app.models.models import ScreenshotResult
+from conftest import random_screenshot
+
+
+def screenshot(sid: str, classification: str, **fields) -> ScreenshotResult:
+    extraction = {
+        "hotel_name": "Hilton Paris",
+        "check_in": "2025-06-01",
+        "check_out": "2025-06-05",
+        "guests": 2,
+        "total_price": 480.0,
+        **fields,
+    }
+    return ScreenshotResult.model_validate(
+        {"screenshot_id": sid, "classification": classification, "extraction": extraction}
+    )
+
+
+def test_compare_bookings_equals_compare_fields():
+    rng = random.Random(1)
+    bookings = [
+        [random_screenshot(rng, f"s{i}") for i in range(rng.randint(0, 6))]
+        for _ in range(200)
+    ]
+    # values differing only in trailing NULs must stay distinct
+    bookings.append([
+        screenshot("a", "initial_quote", hotel_name="Hotel\0"),
+        screenshot("b", "final_booking", hotel_name="Hotel"),
+    ])
+
+    assert compare_bookings(bookings) == [compare_fields(b) for b in bookings]
+
+
+def test_normalized_match_is_not_reported_as_identical():
+    booking = [
+        screenshot("a", "initial_quote", hotel_name="Hilton Paris", check_in="Mon, 1 June 2025"),
+        screenshot("b", "final_booking", hotel_name="hilton-paris"),
+    ]
+    [items] = compare_bookings([booking], normalize_dates=True, hotel_similarity=0.9)
+    by_field = {item.field: item for item in items}
+
+    for field in ("hotel_name", "check_in"):
+        assert by_field[field].status == "match"
+        assert "identical" not in by_field[field].explanation
+    assert by_field["guests"].explanation == "Values are identical for 'guests'."
@@ -0,0 +1,24 @@
+import random
+
+from app.compare_fields import IncrementalComparator, compare_fields
+from app.models.models import ScreenshotResult
+from conftest import random_screenshot
+
+
+def test_incremental_matches_compare_fields_with_re_added_ids():
+    rng = random.Random(0)
+    for _ in range(300):
+        comparator = IncrementalComparator()
+        latest: dict[str, ScreenshotResult] = {}  # in first-added order
+        emitted = {}
+        for _ in range(rng.randint(1, 8)):
+            screenshot = random_screenshot(rng, f"s{rng.randint(1, 4)}")
+            latest[screenshot.screenshot_id] = screenshot
+            for item in comparator.add(screenshot):
+                emitted[item.field] = item
+
+        expected = compare_fields(list(latest.values()))
+        for item in expected:
+            if item.field in emitted:
+                assert emitted[item.field] == item
+        assert comparator.screenshots == list(latest.values())
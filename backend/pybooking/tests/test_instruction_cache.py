@@ -0,0 +1,74 @@
+import pytest
+
+from app import instruction_cache as instruction_cache_module
+from app.instruction_cache import cacheable
+from app.llm_client import MODEL, _PROMPTS, prime_instruction_cache
+from app.main import app
+from conftest import events, upload_files
+
+
+@pytest.fixture
+def low_cache_minimum(monkeypatch):
+    # the fake has no minimum, and the real prompts are below Gemini's
+    monkeypatch.setattr(instruction_cache_module, "INSTRUCTION_CACHE_MIN_TOKENS", "0")
+    cacheable.cache_clear()
+    yield
+    cacheable.cache_clear()
+
+
+def cached_content_sent(fake, monkeypatch) -> list:
+    sent = []
+    generate = fake.aio.models.generate_content_stream
+
+    async def spy(*, model, contents, config=None):
+        sent.append(getattr(config, "cached_content", None))
+        return await generate(model=model, contents=contents, config=config)
+
+    monkeypatch.setattr(fake.aio.models, "generate_content_stream", spy)
+    return sent
+
+
+def test_current_prompts_are_below_the_minimum():
+    cacheable.cache_clear()
+    assert not any(cacheable(MODEL, prompt) for prompt in _PROMPTS.values())
+
+
+@pytest.mark.anyio
+async def test_prime_skips_prompts_below_the_minimum(client):
+    fake = app.state.llm_client
+
+    assert await prime_instruction_cache(fake) is False
+    assert app.state.warmup.steps["instruction_cache"]["status"] == "skipped"
+    assert fake.aio.caches.created == 0
+
+
+@pytest.mark.anyio
+async def test_requests_reference_the_primed_prefix(low_cache_minimum, client, monkeypatch):
+    fake = app.state.llm_client
+    await app.state.warmup.task
+    assert app.state.warmup.steps["instruction_cache"]["status"] == "done"
+    assert len(fake.aio.caches.entries) == 2
+    sent = cached_content_sent(fake, monkeypatch)
+
+    response = await client.post("/stream", files=upload_files(1, 2), data={"mode": "batch"})
+
+    assert events(response.text)[-1]["type"] == "final"
+    assert len(sent) == 1
+    assert sent[0] in fake.aio.caches.entries
+
+
+@pytest.mark.anyio
+async def test_unknown_handle_falls_back_inline(low_cache_minimum, client, monkeypatch):
+    fake = app.state.llm_client
+    await app.state.warmup.task
+    fake.aio.caches.entries.clear()  # expired server-side
+    sent = cached_content_sent(fake, monkeypatch)
+
+    response = await client.post("/stream", files=upload_files(1, 2), data={"mode": "batch"})
+
+    received = events(response.text)
+    assert received[-1]["type"] == "final"
+    assert received[-1]["payload"]["summary"]["overall"] == "match"
+    assert not [e for e in received if "LLM stream error" in str(e["payload"].get("message"))]
+    # the stale handle was tried, then the prompt went inline
+    assert sent[0] is not None and sent[1:] == [None]
@@ -0,0 +1,55 @@
+import json
+import random
+
+from app.ndjson import JSONArrayDecoder, NDJSONDecoder
+
+OBJECTS = [
+    {"type": "extraction", "payload": {"screenshot": {"screenshot_id": "a.png", "note": "braces } { in a string"}}},
+    {"type": "comparison", "payload": {"field": "hotel_name", "explanation": "quote \" and newline \\n escaped"}},
+    {"type": "progress", "payload": {"message": "unicode: café ✓"}},
+    {"type": "final", "payload": {"summary": {"overall": "match", "detail": "done"}}},
+]
+
+# one object per line, one spread over several lines, two sharing a line,
+# and a line of prose the decoder must report as malformed
+NDJSON = (
+    json.dumps(OBJECTS[0]) + "\n"
+    + json.dumps(OBJECTS[1], indent=2) + "\n"
+    + "Here are the remaining events:\n"
+    + json.dumps(OBJECTS[2]) + " " + json.dumps(OBJECTS[3]) + "\n"
+)
+
+
+def chunked(text: str, rng: random.Random) -> list[str]:
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randint(0, min(40, len(text) - 1))))
+    return [text[a:b] for a, b in zip([0, *cuts], [*cuts, len(text)])]
+
+
+def decode(decoder: NDJSONDecoder, chunks: list[str]) -> list[dict]:
+    out = []
+    for chunk in chunks:
+        out += decoder.feed(chunk)
+    return out + decoder.close()
+
+
+def test_ndjson_decoder_is_independent_of_chunking():
+    rng = random.Random(0)
+    for _ in range(500):
+        decoder = NDJSONDecoder()
+        assert decode(decoder, chunked(NDJSON, rng)) == OBJECTS
+        assert decoder.malformed == 1
+
+
+def test_ndjson_decoder_one_character_at_a_time():
+    decoder = NDJSONDecoder()
+    assert decode(decoder, list(NDJSON)) == OBJECTS
+    assert decoder.objects == len(OBJECTS)
+
+
+def test_json_array_decoder_is_independent_of_chunking():
+    text = json.dumps(OBJECTS, indent=2)
+    rng = random.Random(1)
+    for _ in range(500):
+        decoder = JSONArrayDecoder()
+        assert decode(decoder, chunked(text, rng)) == OBJECTS
+        assert decoder.malformed == 0
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from app import singleflight
+from app.main import app
+from conftest import events, png
+
+CONCURRENT_REQUESTS = 20
+
+
+@pytest.mark.anyio
+async def test_identical_concurrent_uploads_call_the_llm_once(client):
+    files = [("initial.png", png(1)), ("final.png", png(2))]
+
+    async def upload() -> list[dict]:
+        response = await client.post(
+            "/stream",
+            files=[("files", (name, data, "image/png")) for name, data in files],
+            data={"mode": "batch"},
+        )
+        assert response.status_code == 200
+        return events(response.text)
+
+    results = await asyncio.gather(*(upload() for _ in range(CONCURRENT_REQUESTS)))
+
+    for received in results:
+        assert received[-1]["type"] == "final"
+        assert received[-1]["payload"]["summary"]["overall"] == "match"
+    assert app.state.llm_client.calls == 1
+    assert app.state.inflight.coalesced == CONCURRENT_REQUESTS - 1
+
+
+@pytest.mark.anyio
+async def test_stream_closed_before_iterating_does_not_keep_the_run(monkeypatch):
+    monkeypatch.setattr(singleflight, "ATTACH_SECONDS", 0.05)
+    inflight = singleflight.SingleFlight(grace_seconds=0)
+
+    async def producer():
+        yield b"data: {}\n\n"
+        await asyncio.sleep(60)
+
+    frames, started = inflight.subscribe("key", producer)
+    await frames.aclose()  # the response went away before streaming
+
+    assert started
+    run = next(iter(inflight._by_id.values()))
+    assert run.subscribers == 0
+    await asyncio.sleep(0.1)
+    assert run.task.cancelled()
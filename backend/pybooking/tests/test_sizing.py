@@ -0,0 +1,20 @@
+import random
+import warnings
+
+from PIL import Image
+
+from app.sizing import analyse_layout
+
+
+def test_layout_of_an_image_without_text_columns():
+    # three levels around a mid-grey median: every column is mostly "ink"
+    rng = random.Random(0)
+    levels = bytes(rng.choice((0, 0, 128, 255, 255)) for _ in range(64 * 64))
+    img = Image.frombytes("L", (64, 64), levels)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        box, line_height = analyse_layout(img)
+
+    assert box == (0, 0, 64, 64)
+    assert line_height is None
@@ -0,0 +1,169 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app import store as store_module
+from app.models.models import ComparisonItem, MatchStatus, ScreenshotResult
+from app.store import ValidationStore
+
+
+@pytest.fixture
+async def store(tmp_path, monkeypatch):
+    # flushes are driven by the tests, not the timer
+    monkeypatch.setattr(store_module, "STORE_FLUSH_SECONDS", 3600)
+    store = ValidationStore(f"sqlite:///{tmp_path / 'validations.db'}")
+    await store.start()
+    yield store
+    await store.close()
+
+
+def screenshot(sid: str, classification: str = "initial_quote", hotel_name: str = "Hotel Example") -> ScreenshotResult:
+    return ScreenshotResult.model_validate(
+        {
+            "screenshot_id": sid,
+            "classification": classification,
+            "extraction": {
+                "hotel_name": hotel_name,
+                "check_in": "2025-06-01",
+                "check_out": "2025-06-05",
+                "guests": 2,
+                "total_price": 480.0,
+            },
+        }
+    )
+
+
+def unclear(sid: str) -> ScreenshotResult:
+    return ScreenshotResult.model_validate(
+        {
+            "screenshot_id": sid,
+            "classification": "initial_quote",
+            "extraction": {f: "unclear" for f in ("hotel_name", "check_in", "check_out", "guests", "total_price")},
+        }
+    )
+
+
+COMPARISON = ComparisonItem(
+    field="hotel_name",
+    initial_value="Hotel Example",
+    final_value="Hotel Example",
+    status=MatchStatus.MATCH,
+    explanation="Values are identical for 'hotel_name'.",
+    evidence=["a.png", "b.png"],
+)
+
+
+async def save(store: ValidationStore, *screenshots: ScreenshotResult, hotel_name: str = "Hotel Example") -> str:
+    return await store.save(
+        "batch",
+        None,
+        list(screenshots),
+        {s.screenshot_id: f"key-{s.screenshot_id}" for s in screenshots},
+        [COMPARISON],
+        {"overall": "match", "detail": hotel_name},
+    )
+
+
+@pytest.mark.anyio
+async def test_saves_are_written_in_one_batch(store, monkeypatch):
+    monkeypatch.setattr(store_module, "STORE_BATCH_SIZE", 3)
+    batches = []
+    write_batch = store._write_batch
+    monkeypatch.setattr(store, "_write_batch", lambda rows: (batches.append(len(rows)), write_batch(rows)))
+
+    ids = await asyncio.gather(*(save(store, screenshot(f"{n}.png")) for n in range(3)))
+
+    assert batches == [3]
+    assert len(set(ids)) == 3
+    assert all([await store.validation(validation_id) for validation_id in ids])
+
+
+@pytest.mark.anyio
+async def test_failed_flush_is_retried(store, monkeypatch):
+    failures = [sqlite3.OperationalError("database is locked")]
+    write_batch = store._write_batch
+
+    def flaky(rows):
+        if failures:
+            raise failures.pop()
+        write_batch(rows)
+
+    monkeypatch.setattr(store, "_write_batch", flaky)
+    saved = asyncio.create_task(save(store, screenshot("a.png")))
+    await asyncio.sleep(0)
+
+    await store.flush()
+    assert not saved.done()
+    await store.flush()
+    assert (await store.validation(await saved))["summary"]["overall"] == "match"
+
+
+@pytest.mark.anyio
+async def test_validation_dropped_after_max_attempts(store, monkeypatch):
+    monkeypatch.setattr(store_module, "STORE_MAX_ATTEMPTS", 2)
+
+    def broken(rows):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(store, "_write_batch", broken)
+    saved = asyncio.create_task(save(store, screenshot("a.png")))
+    await asyncio.sleep(0)
+    await store.flush()
+    await store.flush()
+
+    with pytest.raises(RuntimeError, match="validation not stored"):
+        await saved
+
+
+@pytest.mark.anyio
+async def test_find_extractions_by_hash(store):
+    save_task = asyncio.create_task(save(store, screenshot("a.png", hotel_name="Old Name"), unclear("u.png")))
+    await asyncio.sleep(0)
+    await store.flush()
+    await save_task
+    save_task = asyncio.create_task(save(store, screenshot("a.png", hotel_name="New Name")))
+    await asyncio.sleep(0)
+    await store.flush()
+    await save_task
+
+    found = await store.find_extractions(["key-a.png", "key-u.png", "key-missing"])
+
+    # the latest extraction wins; all-unclear ones are never served
+    assert list(found) == ["key-a.png"]
+    assert found["key-a.png"].extraction.hotel_name == "New Name"
+
+
+@pytest.mark.anyio
+async def test_history_and_validation(store):
+    tasks = [
+        asyncio.create_task(save(store, screenshot("a.png"), screenshot("b.png", "final_booking"))),
+        asyncio.create_task(save(store, screenshot("c.png", hotel_name="Other Hotel"), hotel_name="Other Hotel")),
+    ]
+    await asyncio.sleep(0)
+    await store.flush()
+    first, second = await asyncio.gather(*tasks)
+
+    assert {row["id"] for row in await store.history()} == {first, second}
+    assert [row["id"] for row in await store.history(hotel_name="Other Hotel")] == [second]
+    assert [row["id"] for row in await store.history(image_key="key-a.png")] == [first]
+
+    stored = await store.validation(first)
+    assert [e["screenshot"]["screenshot_id"] for e in stored["extractions"]] == ["a.png", "b.png"]
+    assert stored["extractions"][0]["image_key"] == "key-a.png"
+    assert stored["comparisons"] == [COMPARISON.model_dump(mode="json")]
+    assert await store.validation("missing") is None
+
+
+@pytest.mark.anyio
+async def test_close_closes_every_connection(tmp_path):
+    store = ValidationStore(f"sqlite:///{tmp_path / 'validations.db'}")
+    await store.start()
+    await store.history()
+    connections = list(store._connections)
+    await store.close()
+
+    assert connections
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
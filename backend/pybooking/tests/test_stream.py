@@ -0,0 +1,115 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app import uploads
+from app.main import app
+from app.scheduler import Scheduler
+from conftest import events, png, upload_files
+
+
+def frames(body: str) -> list[tuple[str | None, str]]:
+    """
+    (id, data) of each SSE frame.
+    """
+
+    out = []
+    for frame in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.splitlines() if ": " in line)
+        if "data" in fields:
+            out.append((fields.get("id"), fields["data"]))
+    return out
+
+
+@pytest.mark.parametrize("mode", ["batch", "per_screenshot", "structured"])
+@pytest.mark.anyio
+async def test_fake_backend_validates_in_every_mode(client, mode):
+    response = await client.post("/stream", files=upload_files(1, 2), data={"mode": mode})
+
+    assert response.status_code == 200
+    received = events(response.text)
+    extractions = [e["payload"]["screenshot"]["screenshot_id"] for e in received if e["type"] == "extraction"]
+    assert sorted(extractions) == ["final.png", "initial.png"]
+    assert received[-1]["type"] == "final"
+    assert received[-1]["payload"]["summary"]["overall"] == "match"
+
+
+@pytest.mark.anyio
+async def test_resume_replays_frames_after_last_event_id(client):
+    response = await client.post("/stream", files=upload_files(1, 2), data={"mode": "batch"})
+    original = [(event_id, data) for event_id, data in frames(response.text) if event_id]
+    assert len(original) > 3
+    run_id = original[0][0].rsplit(":", 1)[0]
+
+    last_seen = original[2][0]
+    resumed = await client.get(f"/stream/{run_id}", headers={"Last-Event-ID": last_seen})
+    assert resumed.status_code == 200
+    assert frames(resumed.text) == original[3:]
+
+    # ?after= works without the header, and unknown runs are gone
+    seq = int(original[-2][0].rsplit(":", 1)[1])
+    assert frames((await client.get(f"/stream/{run_id}", params={"after": seq})).text) == original[-1:]
+    assert (await client.get("/stream/no-such-run")).status_code == 404
+
+
+@pytest.mark.anyio
+async def test_requests_queue_for_a_slot_and_overflow_is_rejected(client, monkeypatch):
+    scheduler = Scheduler(max_concurrency=1, max_queue=1, requests_per_minute=0, requests_per_day=0)
+    monkeypatch.setattr(app.state, "scheduler", scheduler)
+
+    async def upload(seed: int):
+        return await client.post("/stream", files=upload_files(seed, seed + 100), data={"mode": "batch"})
+
+    first, second = await asyncio.gather(upload(1), upload(2))
+    queued = [
+        any(e["payload"].get("message") == "queued" for e in events(r.text) if e["type"] == "progress")
+        for r in (first, second)
+    ]
+    assert sorted(queued) == [False, True]
+    assert all(events(r.text)[-1]["type"] == "final" for r in (first, second))
+
+    held = [scheduler.admit(), scheduler.admit()]  # one running slot, one queue place
+    rejected = await upload(3)
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 0
+    for ticket in held:
+        scheduler.release(ticket)
+
+
+@pytest.mark.anyio
+async def test_failed_ingest_releases_the_ticket(client, monkeypatch):
+    def broken(raw):
+        raise BrokenProcessPool("worker died")
+
+    monkeypatch.setattr(uploads, "submit_compress", broken)
+    for _ in range(3):
+        with pytest.raises(BrokenProcessPool):
+            await client.post("/stream", files=upload_files(1, 2), data={"mode": "batch"})
+
+    assert app.state.scheduler.queue_depth == 0
+
+
+@pytest.mark.anyio
+async def test_escalated_screenshot_is_not_retried(client, monkeypatch):
+    fake = app.state.llm_client
+    readable = fake.screenshot_for
+
+    def screenshot_for(sid: str) -> dict:
+        screenshot = readable(sid)
+        if "blurry" in sid:
+            screenshot["extraction"] = {field: "unclear" for field in screenshot["extraction"]}
+        return screenshot
+
+    monkeypatch.setattr(fake, "screenshot_for", screenshot_for)
+    files = [
+        ("files", ("initial.png", png(1), "image/png")),
+        ("files", ("blurry-final.png", png(2), "image/png")),
+    ]
+    response = await client.post("/stream", files=files, data={"mode": "per_screenshot"})
+
+    messages = [e["payload"].get("message") for e in events(response.text) if e["type"] == "progress"]
+    assert "escalating_screenshots" in messages
+    assert "retrying_screenshots" not in messages
+    # both on the fast tier, then the unreadable one once on the strong model
+    assert fake.calls == 3
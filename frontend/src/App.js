@@ -76,7 +76,10 @@ const App = () => {
       if (ev.type === "comparison") {
         setStreamState((s) => ({
           ...s,
-          comparisons: [...s.comparisons, ev.payload],
+          // a field's later comparison (provisional → final) replaces the earlier one
+          comparisons: s.comparisons.some((c) => c.field === ev.payload.field)
+            ? s.comparisons.map((c) => (c.field === ev.payload.field ? ev.payload : c))
+            : [...s.comparisons, ev.payload],
           logs: [
             ...s.logs,
             {
@@ -1,33 +1,35 @@
-export const startStreamUpload = async (files, context, onEvent) => {
-  const form = new FormData();
-  for (const f of files) form.append("files", f, f.name);
-  if (context) form.append("context", context);
+const MAX_RESUME_ATTEMPTS = 5;
+
+const chunkSSEBuffer = (buf) => {
+  const parts = buf.split("\n\n");
+  if (parts.length === 0) return [[], ""];
+  const rest = parts.pop();
+  return [parts, rest];
+};
+
+const parseSSEMessage = (msg) => {
+  const lines = msg
+    .split("\n")
+    .map((l) => l.trim())
+    .filter(Boolean);
+  const idLine = lines.find((l) => l.startsWith("id:"));
+  const dataLines = lines.filter((l) => l.startsWith("data:"));
+  return {
+    id: idLine ? idLine.slice(3).trim() : null,
+    data: dataLines.map((l) => l.slice(5).trim()),
+  };
+};
 
-  const resp = await fetch(`${process.env.REACT_APP_BACKEND_URL}/stream`, {
-    method: "POST",
-    body: form,
-  });
+// Reads an SSE response, calling onEvent for each event and onId for each
+// event id. Resolves once the server ends the stream; rejects if the
+// connection drops.
+const readStream = async (resp, onEvent, onId) => {
   if (!resp.body) throw new Error("Server returned no body");
 
   const reader = resp.body.getReader();
   const decoder = new TextDecoder();
   let buf = "";
 
-  const chunkSSEBuffer = (buf) => {
-    const parts = buf.split("\n\n");
-    if (parts.length === 0) return [[], ""];
-    const rest = parts.pop();
-    return [parts, rest];
-  };
-  const parseSSEMessage = (msg) => {
-    const lines = msg
-      .split("\n")
-      .map((l) => l.trim())
-      .filter(Boolean);
-    const dataLines = lines.filter((l) => l.startsWith("data:"));
-    return dataLines.map((l) => l.slice(5).trim());
-  };
-
   while (true) {
     const { done, value } = await reader.read();
     if (done) break;
@@ -35,8 +37,9 @@ export const startStreamUpload = async (files, context, onEvent) => {
     const [messages, rest] = chunkSSEBuffer(buf);
     buf = rest;
     for (const m of messages) {
-      const pieces = parseSSEMessage(m);
-      for (const p of pieces) {
+      const { id, data } = parseSSEMessage(m);
+      if (id) onId(id);
+      for (const p of data) {
         try {
           const ev = JSON.parse(p);
           if (onEvent) onEvent(ev);
@@ -51,3 +54,61 @@ export const startStreamUpload = async (files, context, onEvent) => {
     }
   }
 };
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+export const startStreamUpload = async (files, context, onEvent) => {
+  const form = new FormData();
+  for (const f of files) form.append("files", f, f.name);
+  if (context) form.append("context", context);
+
+  // Event ids are "<runId>:<seq>"; the last one seen is where a resume starts.
+  let lastEventId = null;
+  let finished = false;
+  const onId = (id) => {
+    lastEventId = id;
+  };
+  const track = (ev) => {
+    if (ev && ev.type === "final") finished = true;
+    if (onEvent) onEvent(ev);
+  };
+
+  let error = null;
+  try {
+    const resp = await fetch(`${process.env.REACT_APP_BACKEND_URL}/stream`, {
+      method: "POST",
+      body: form,
+    });
+    await readStream(resp, track, onId);
+  } catch (err) {
+    error = err;
+  }
+
+  // A dropped connection resumes the same run from the server's buffer
+  // instead of uploading again (which would call the model again).
+  for (
+    let attempt = 0;
+    error && !finished && lastEventId && attempt < MAX_RESUME_ATTEMPTS;
+    attempt++
+  ) {
+    await sleep(Math.min(8000, 500 * 2 ** attempt));
+    const runId = lastEventId.slice(0, lastEventId.lastIndexOf(":"));
+    try {
+      const resp = await fetch(
+        `${process.env.REACT_APP_BACKEND_URL}/stream/${runId}`,
+        { headers: { "Last-Event-ID": lastEventId } }
+      );
+      if (resp.status === 404) break; // run expired
+      if (!resp.ok)
+        throw new Error(`Resume failed with status ${resp.status}`);
+      if (onEvent)
+        onEvent({ type: "progress", payload: { message: "stream_resumed" } });
+      error = null;
+      await readStream(resp, track, onId);
+    } catch (err) {
+      error = err;
+    }
+  }
+
+  if (error && !finished) throw error;
+};